@@ -60,7 +60,13 @@ def load_and_run():
         if not all_partitions_flat[action[0]].no_more_partitions:
             partitions.append((all_partitions_flat[action[0]], reward[0]))
 
-    utils.output_partitions(partitions, experiment.schema.database_name, experiment.experiment_folder_path)
+    utils.output_partitions(
+        partitions,
+        experiment.schema.database_name,
+        experiment.experiment_folder_path,
+        persistent_cost_cache=experiment.config["persistent_cost_cache"],
+        connector_factory=experiment.connector_factory,
+    )
 
     
     # model = experiment.load_model(algorithm_class, training_env)
@@ -101,11 +107,14 @@ if __name__ == "__main__":
 
     experiment.prepare() 
 
-    ParallelEnv = SubprocVecEnv if experiment.config["parallel_environments"] > 1 else DummyVecEnv
+    if experiment.config["vectorized_environment"]:
+        training_env = experiment.make_vec_env(experiment.config["parallel_environments"])
+    else:
+        ParallelEnv = SubprocVecEnv if experiment.config["parallel_environments"] > 1 else DummyVecEnv
 
-    training_env = ParallelEnv(
-        [experiment.make_env(env_id) for env_id in range(experiment.config["parallel_environments"])]
-    )
+        training_env = ParallelEnv(
+            [experiment.make_env(env_id) for env_id in range(experiment.config["parallel_environments"])]
+        )
     training_env = VecNormalize(
         training_env, norm_obs=True, norm_reward=True, gamma=experiment.config["rl_algorithm"]["gamma"], training=True
     )
@@ -1,4 +1,3 @@
-import copy
 import logging
 
 import numpy as np
@@ -37,14 +36,17 @@ class ActionManager(object):
     def get_initial_valid_actions(self, workload):
         self.current_action_status = [0 for action in range(self.number_of_actions)]
 
-        self.valid_actions = [self.FORBIDDEN_ACTION for action in range(self.number_of_actions)]
-        self._remaining_valid_actions = []
+        # valid_actions holds ALLOWED_ACTION/FORBIDDEN_ACTION per action,
+        # _remaining_valid_actions is the corresponding boolean mask
+        self.valid_actions = np.full(self.number_of_actions, self.FORBIDDEN_ACTION)
+        self._remaining_valid_actions = np.zeros(self.number_of_actions, dtype=bool)
 
         self._valid_actions_based_on_workload(workload)
 
-        self.current_partitions = set()
+        # Bitmask over the partitions' ids
+        self.current_partitions = 0
 
-        return np.array(self.valid_actions)
+        return self.valid_actions.copy()
 
     def update_valid_actions(self, last_action):
         # if last_action == len(self.valid_actions) - 1:
@@ -52,21 +54,22 @@ class ActionManager(object):
         #         self.valid_actions[action_idx] = self.FORBIDDEN_ACTION
         #         self._remaining_valid_actions.remove(action_idx)
         #     return np.array(self.valid_actions), False
-        assert self.all_partitions_flat[last_action] not in self.current_partitions
+        last_partition_bit = 1 << self.all_partitions_flat[last_action].id
+        assert not self.current_partitions & last_partition_bit
 
 
         self.current_action_status[last_action] += 1
     
-        self.current_partitions.add(self.all_partitions_flat[last_action])
+        self.current_partitions |= last_partition_bit
 
         self.valid_actions[last_action] = self.FORBIDDEN_ACTION
-        self._remaining_valid_actions.remove(last_action)
+        self._remaining_valid_actions[last_action] = False
 
         self._valid_actions_based_on_last_action(last_action)
 
-        is_valid_action_left = len(self._remaining_valid_actions) > 0
+        is_valid_action_left = bool(self._remaining_valid_actions.any())
 
-        return np.array(self.valid_actions), is_valid_action_left
+        return self.valid_actions.copy(), is_valid_action_left
 
     # def _valid_actions_based_on_budget(self, budget, current_storage_consumption):
     #     if budget is None:
@@ -109,35 +112,57 @@ class PartitionActionManager(ActionManager):
 
         self.number_of_actions = len(self.all_partitions_flat)
 
-    def _valid_actions_based_on_last_action(self, last_action):
-
-        last_partition = self.all_partitions_flat[last_action]
-        last_column = last_partition.column
-        last_table = last_column.table
-
-        for partition_idx in copy.copy(self._remaining_valid_actions):
-            partition = self.all_partitions_flat[partition_idx]
-            column = partition.column
-            table = column.table
-            if column.is_date() and column == last_column:
-                self.valid_actions[partition_idx] = self.FORBIDDEN_ACTION
-                self._remaining_valid_actions.remove(partition_idx)
-            elif table == last_table and (column != last_column or last_partition.no_more_partitions) and not partition.no_more_partitions:
-                self.valid_actions[partition_idx] = self.FORBIDDEN_ACTION
-                self._remaining_valid_actions.remove(partition_idx)
+        # Per action: ids of the partition's table and column, and whether it is a column's no_more_partitions
+        # action or on a date column. Masks are derived from these arrays instead of comparing the objects.
+        table_ids = {}
+        column_ids = {}
+        for partition in self.all_partitions_flat:
+            table_ids.setdefault(partition.column.table, len(table_ids))
+            column_ids.setdefault(partition.column, len(column_ids))
+        self.column_ids = column_ids
+        self.action_table_ids = np.array([table_ids[partition.column.table] for partition in self.all_partitions_flat])
+        self.action_column_ids = np.array([column_ids[partition.column] for partition in self.all_partitions_flat])
+        self.action_no_more_partitions = np.array(
+            [partition.no_more_partitions for partition in self.all_partitions_flat], dtype=bool
+        )
+        self.action_is_date = np.array([partition.column.is_date() for partition in self.all_partitions_flat], dtype=bool)
+
+        # {frozenset of the workload's partitionable columns: initially remaining valid actions}
+        self.initial_remaining_valid_actions_cache = {}
 
+    def _valid_actions_based_on_last_action(self, last_action):
+        last_column_id = self.action_column_ids[last_action]
+        last_no_more_partitions = self.action_no_more_partitions[last_action]
+
+        same_column = self.action_column_ids == last_column_id
+        # All partitions of a date column are exclusive
+        forbidden = self.action_is_date & same_column
+        # After partitioning a table on a column, its other columns cannot be used. After no_more_partitions,
+        # no further partitions of the table are allowed. The no_more_partitions actions remain valid.
+        forbidden |= (
+            (self.action_table_ids == self.action_table_ids[last_action])
+            & (~same_column | last_no_more_partitions)
+            & ~self.action_no_more_partitions
+        )
+        forbidden &= self._remaining_valid_actions
+
+        self.valid_actions[forbidden] = self.FORBIDDEN_ACTION
+        self._remaining_valid_actions &= ~forbidden
 
     def _valid_actions_based_on_workload(self, workload):
         partitionable_columns = workload.partitionable_columns(return_sorted=False)
         partitionable_columns = partitionable_columns & frozenset(self.partitionable_columns_flat)
         self.wl_partitionable_columns = partitionable_columns
 
-        for partition_idx, partition in enumerate(
-                self.all_partitions_flat
-        ):
-            if partition.column in partitionable_columns:
-                self.valid_actions[partition_idx] = self.ALLOWED_ACTION
-                self._remaining_valid_actions.append(partition_idx)
+        if partitionable_columns not in self.initial_remaining_valid_actions_cache:
+            workload_column_ids = [self.column_ids[column] for column in partitionable_columns if column in self.column_ids]
+            self.initial_remaining_valid_actions_cache[partitionable_columns] = np.isin(
+                self.action_column_ids, workload_column_ids
+            )
+        remaining_valid_actions = self.initial_remaining_valid_actions_cache[partitionable_columns]
+
+        self._remaining_valid_actions[:] = remaining_valid_actions
+        self.valid_actions[remaining_valid_actions] = self.ALLOWED_ACTION
 
 
         # assert np.count_nonzero(np.array(self.valid_actions) == self.ALLOWED_ACTION)-1 == 10*len(
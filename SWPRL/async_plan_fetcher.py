@@ -0,0 +1,74 @@
+import asyncio
+import logging
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from index_selection_evaluation.selection.dbms.postgres_dbms import PostgresDatabaseConnector
+
+
+def _postgres_connector(database_name):
+    return PostgresDatabaseConnector(database_name, autocommit=True)
+
+
+# Fetches plans concurrently over a small pool of database connections.
+# psycopg2 releases the GIL while it waits for the server, hence, the blocking get_plan
+# calls are run in worker threads and coordinated by an asyncio event loop.
+# connector_factory(database_name) can be replaced, e.g., by a fake connector for testing.
+class AsyncPlanFetcher(object):
+    def __init__(self, database_name, max_concurrency, connector_factory=_postgres_connector):
+        logging.debug(f"Init AsyncPlanFetcher with a maximum concurrency of {max_concurrency}")
+        assert max_concurrency > 0, "The maximum concurrency must be positive."
+
+        self.database_name = database_name
+        self.max_concurrency = max_concurrency
+        self.connector_factory = connector_factory
+
+        # Connections are created lazily, at most max_concurrency of them
+        self.idle_connectors = queue.Queue()
+        self.connectors = []
+        self.connectors_lock = threading.Lock()
+
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency)
+
+    # Returns the plans in the order of the given queries
+    def fetch_plans(self, queries):
+        if len(queries) == 0:
+            return []
+        return asyncio.run(self._fetch_plans(queries))
+
+    async def _fetch_plans(self, queries):
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        return await asyncio.gather(*[self._fetch_plan(query, semaphore) for query in queries])
+
+    async def _fetch_plan(self, query, semaphore):
+        async with semaphore:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, self._get_plan, query)
+
+    def _get_plan(self, query):
+        connector = self._acquire_connector()
+        try:
+            return connector.get_plan(query)
+        finally:
+            self.idle_connectors.put(connector)
+
+    def _acquire_connector(self):
+        try:
+            return self.idle_connectors.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self.connectors_lock:
+            if len(self.connectors) < self.max_concurrency:
+                connector = self.connector_factory(self.database_name)
+                self.connectors.append(connector)
+                return connector
+
+        return self.idle_connectors.get()
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        for connector in self.connectors:
+            connector.close()
+        self.connectors = []
@@ -1,49 +1,55 @@
+import functools
 import re
 from string import digits
 
+# Characters and type casts that are removed from attribute values, e.g., filters and join conditions
+REMOVED_CHARACTERS = str.maketrans("", "", " ()[]")
+TYPE_CASTS = re.compile("::(?:text|bpchar|date|interval|numeric|timestamp)")
+
+# Operators that are part of the bag of operators and the methods that represent them
+NODE_PARSERS = {
+    "Seq Scan": "_parse_seq_scan",
+    "Hash Join": "_parse_hash_join",
+    "Nested Loop": "_parse_nested_loop",
+    "Index Only Scan": "_parse_index_only_scan",
+    "Index Scan": "_parse_index_scan",
+    "Merge Join": "_parse_merge_join",
+    "Sort": "_parse_sort",
+}
+
+
+# The plans of a workload repeat the same filters and conditions, hence, their normalizations are cached
+@functools.lru_cache(maxsize=65536)
+def normalize_attribute(value):
+    return TYPE_CASTS.sub("", value.translate(REMOVED_CHARACTERS))
+
 
 class BagOfOperators(object):
     def __init__(self):
-        self.replacings = [(" ", ""), ("(", ""), (")", ""), ("[", ""), ("]", ""), ("::text", ""), ("::bpchar", ""), ("::date", ""), ("::interval", ""), ("::numeric", ""), ("::timestamp", "")]
         self.remove_digits = str.maketrans("", "", digits)
-        self.INTERESTING_OPERATORS = [
-            "Seq Scan",
-            "Hash Join",
-            "Nested Loop",
-            "Index Only Scan",
-            "Index Scan",
-            "Merge Join",
-            "Sort",
-        ]
+        self.INTERESTING_OPERATORS = list(NODE_PARSERS)
 
         self.relevant_operators = None
 
+    # Walks the plan depth-first with an explicit stack, in the order of the former recursive walk
     def boo_from_plan(self, plan):
-        self.relevant_operators = []
-        self._parse_plan(plan)
-
-        return self.relevant_operators
-
-    def _parse_plan(self, plan):
-        node_type = plan["Node Type"]
-
-        if node_type in self.INTERESTING_OPERATORS:
-            node_representation = self._parse_node(plan)
-            self.relevant_operators.append(node_representation)
-        if "Plans" not in plan:
-            return
-        for sub_plan in plan["Plans"]:
-            self._parse_plan(sub_plan)
+        relevant_operators = []
+        plans = [plan]
+        while plans:
+            node = plans.pop()
+            if node["Node Type"] in NODE_PARSERS:
+                relevant_operators.append(self._parse_node(node))
+            if "Plans" in node:
+                plans.extend(reversed(node["Plans"]))
+        self.relevant_operators = relevant_operators
+
+        return relevant_operators
 
     def _stringify_attribute_columns(self, node, attribute):
-        attribute_representation = f"{attribute.replace(' ', '')}_"
         if attribute not in node:
-            return attribute_representation
-
-        value = node[attribute]
+            return f"{attribute.replace(' ', '')}_"
 
-        for replacee, replacement in self.replacings:
-            value = value.replace(replacee, replacement)
+        value = normalize_attribute(node[attribute])
 
         # value = re.sub('".*?"', "", value)
         # value = re.sub("'.*?'", "", value)
@@ -56,13 +62,10 @@ class BagOfOperators(object):
         if attribute not in node:
             return attribute_representation
 
-        assert isinstance(node[attribute], list)
+        assert isinstance(node[attribute], (list, tuple))
         value = node[attribute]
 
-        for element in value:
-            attribute_representation += f"{element}_"
-
-        return attribute_representation
+        return attribute_representation + "".join([f"{element}_" for element in value])
 
     def _parse_bool_attribute(self, node, attribute):
         attribute_representation = f"{attribute.replace(' ', '')}_"
@@ -89,81 +92,39 @@ class BagOfOperators(object):
     def _parse_seq_scan(self, node):
         assert "Relation Name" in node
 
-        node_representation = ""
-        node_representation += f"{node['Relation Name']}_"
-
-        node_representation += self._stringify_attribute_columns(node, "Filter")
-
-        return node_representation
+        return f"{node['Relation Name']}_{self._stringify_attribute_columns(node, 'Filter')}"
 
     def _parse_index_scan(self, node):
         assert "Relation Name" in node
 
-        node_representation = ""
-        node_representation += f"{node['Relation Name']}_"
-
-        node_representation += self._stringify_attribute_columns(node, "Filter")
-        node_representation += self._stringify_attribute_columns(node, "Index Cond")
+        filter_representation = self._stringify_attribute_columns(node, "Filter")
+        index_cond_representation = self._stringify_attribute_columns(node, "Index Cond")
 
-        return node_representation
+        return f"{node['Relation Name']}_{filter_representation}{index_cond_representation}"
 
     def _parse_index_only_scan(self, node):
         assert "Relation Name" in node
 
-        node_representation = ""
-        node_representation += f"{node['Relation Name']}_"
-
-        node_representation += self._stringify_attribute_columns(node, "Index Cond")
-
-        return node_representation
+        return f"{node['Relation Name']}_{self._stringify_attribute_columns(node, 'Index Cond')}"
 
     def _parse_nested_loop(self, node):
-        node_representation = ""
-
-        node_representation += self._stringify_attribute_columns(node, "Join Filter")
-
-        return node_representation
+        return self._stringify_attribute_columns(node, "Join Filter")
 
     def _parse_hash_join(self, node):
-        node_representation = ""
-
-        node_representation += self._stringify_attribute_columns(node, "Join Filter")
-        node_representation += self._stringify_attribute_columns(node, "Hash Cond")
+        join_filter_representation = self._stringify_attribute_columns(node, "Join Filter")
+        hash_cond_representation = self._stringify_attribute_columns(node, "Hash Cond")
 
-        return node_representation
+        return f"{join_filter_representation}{hash_cond_representation}"
 
     def _parse_merge_join(self, node):
-        node_representation = ""
-
-        node_representation += self._stringify_attribute_columns(node, "Merge Cond")
-
-        return node_representation
+        return self._stringify_attribute_columns(node, "Merge Cond")
 
     def _parse_sort(self, node):
-        node_representation = ""
-
-        node_representation += self._stringify_list_attribute(node, "Sort Key")
-
-        return node_representation
+        return self._stringify_list_attribute(node, "Sort Key")
 
     def _parse_node(self, node):
-        node_representation = f"{node['Node Type'].replace(' ', '')}_"
-
-        if node["Node Type"] == "Seq Scan":
-            node_representation += f"{self._parse_seq_scan(node)}"
-        elif node["Node Type"] == "Index Only Scan":
-            node_representation += f"{self._parse_index_only_scan(node)}"
-        elif node["Node Type"] == "Index Scan":
-            node_representation += f"{self._parse_index_scan(node)}"
-        elif node["Node Type"] == "Nested Loop":
-            node_representation += f"{self._parse_nested_loop(node)}"
-        elif node["Node Type"] == "Hash Join":
-            node_representation += f"{self._parse_hash_join(node)}"
-        elif node["Node Type"] == "Merge Join":
-            node_representation += f"{self._parse_merge_join(node)}"
-        elif node["Node Type"] == "Sort":
-            node_representation += f"{self._parse_sort(node)}"
-        else:
+        node_type = node["Node Type"]
+        if node_type not in NODE_PARSERS:
             raise ValueError("_parse_node called with unsupported Node Type.")
 
-        return node_representation
+        return f"{node_type.replace(' ', '')}_{getattr(self, NODE_PARSERS[node_type])(node)}"
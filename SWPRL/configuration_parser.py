@@ -53,6 +53,14 @@ class ConfigurationParser(object):
 
         self._translate_column_filters()
         self._translate_model_architecture()
+        self._translate_persistent_cost_cache()
+        self._translate_plan_fetch_concurrency()
+        self._translate_cache_limits()
+        self._translate_vectorized_environment()
+        self._translate_observation_dtype()
+        self._translate_transition_cache()
+        self._translate_database_connector()
+        self._translate_prefetch_next_workload()
 
         self._check_dependencies()
 
@@ -82,11 +90,69 @@ class ConfigurationParser(object):
 
         self.config["column_filters"] = {}
 
+    def _translate_persistent_cost_cache(self):
+        if "persistent_cost_cache" in self.config:
+            return
+
+        # Plans and percentiles are only persisted across runs if a path is configured
+        self.config["persistent_cost_cache"] = None
+
+    def _translate_plan_fetch_concurrency(self):
+        if "plan_fetch_concurrency" in self.config:
+            return
+
+        # A single connection with batched plan requests
+        self.config["plan_fetch_concurrency"] = 1
+
+    def _translate_cache_limits(self):
+        if "cache_limits" in self.config:
+            return
+
+        # Unbounded caches
+        self.config["cache_limits"] = {}
+
+    def _translate_vectorized_environment(self):
+        if "vectorized_environment" in self.config:
+            return
+
+        # One process per parallel environment
+        self.config["vectorized_environment"] = False
+
+    def _translate_observation_dtype(self):
+        if "observation_dtype" in self.config:
+            return
+
+        self.config["observation_dtype"] = "float64"
+
+    def _translate_transition_cache(self):
+        if "transition_cache" in self.config:
+            return
+
+        # Every step is evaluated
+        self.config["transition_cache"] = None
+
+    def _translate_database_connector(self):
+        if "database_connector" in self.config:
+            return
+
+        # Live database connections without recording
+        self.config["database_connector"] = {}
+
+    def _translate_prefetch_next_workload(self):
+        if "prefetch_next_workload" in self.config:
+            return
+
+        # Plans and percentiles are fetched when an episode starts
+        self.config["prefetch_next_workload"] = False
+
     def _check_dependencies(self):
         if self.config["rl_algorithm"]["algorithm"] == "DQN":
             if self.config["parallel_environments"] > 1:
                 raise ValueError("For DQN parallel parallel_environments must be 1.")
 
+        if self.config["vectorized_environment"]:
+            assert self.config["gym_version"] == 2, "Vectorized environments are only available for DB-v2."
+
         if "Embedding" in self.config["observation_manager"]:
             assert (
                 "workload_embedder" in self.config
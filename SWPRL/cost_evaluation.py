@@ -1,46 +1,97 @@
 import datetime
 import calendar
 import logging
-import decimal
 
 from .what_if_partition_creation import WhatIfPartitionCreation
 from .import utils
-
-from .expression_parser import ExpressionParser
+from . import range_pruning
+
+from . import expression_parser
+from .lru_cache import LRUCache
+from .persistent_cost_cache import PersistentCostCache, database_fingerprint
+from .plan import PlanNode
+
+# Plans for several queries are retrieved with one round trip through this server-side function.
+# It lives in pg_temp, i.e., it only exists for the connection's session.
+EXPLAIN_BATCH_FUNCTION = """
+CREATE OR REPLACE FUNCTION pg_temp.swprl_explain_batch(query_texts text[]) RETURNS SETOF json AS $$
+DECLARE
+    query_text text;
+    query_plan json;
+BEGIN
+    FOREACH query_text IN ARRAY query_texts LOOP
+        EXECUTE 'EXPLAIN (FORMAT JSON) ' || query_text INTO query_plan;
+        RETURN NEXT query_plan;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+"""
+EXPLAIN_BATCH_SIZE = 100
 
 
 class CostEvaluation:
-    def __init__(self, db_connector):
+    def __init__(
+        self, db_connector, all_partitions_flat=None, persistent_cache_path=None, plan_fetcher=None, cache_limits=None
+    ):
         logging.debug("Init cost evaluation")
         self.db_connector = db_connector
+        # Optional concurrent alternative to the batched plan retrieval, e.g., an AsyncPlanFetcher
+        self.plan_fetcher = plan_fetcher
+        # Partition sets are passed around as int bitmasks over the partitions' ids
+        self.all_partitions_flat = all_partitions_flat
         self.what_if = WhatIfPartitionCreation(db_connector)
         self.current_partitions = set()
 
         if len(self.current_partitions) != 0:
             assert len(self.what_if.all_simulated_partitions()) == len(self.current_partitions)
 
-        self.expression_parser = ExpressionParser()
+        self.expression_parser = expression_parser.ExpressionParser()
 
         self.cost_requests = 0
         self.cache_hits = 0
+        self.explain_batch_function_created = False
+        # Caches are bounded by the optional {"max_entries": ..., "max_bytes": ...} limits per cache name
+        cache_limits = cache_limits or {}
+        # The plan of a query does not depend on the (simulated) partitions.
         # Cache structure:
-        # {(query_object, relevant_partitions): cost}
-        self.cache = {}
+        # {query_text: (cost, plan)}
+        self.cache = LRUCache.from_limits(cache_limits.get("plans"))
 
+        # Second level cache for the estimated costs.
         # Cache structure:
-        # {(query_object, relevant_partitions): (cost, plan)}
-        self.cache_plans = {}
+        # {(query_text, relevant_partitions_bitmask): estimated_cost}
+        self.cache_estimated_costs = LRUCache.from_limits(cache_limits.get("estimated_costs"))
+        self.estimated_cost_requests = 0
+        self.estimated_cost_hits = 0
 
         self.completed = False
 
-        self.relevant_partitions_cache = {}
+        # Cache structure:
+        # {query_text: bitmask of the partitions on the query's columns}
+        self.query_partition_masks = {}
 
         self.cache_percentiles = {}
+        self.cache_percentile_values = {}
 
-        self.cache_intervals = {}
+        self.cache_intervals = LRUCache.from_limits(cache_limits.get("intervals"))
 
         self.costing_time = datetime.timedelta(0)
 
+        # Plans, percentiles, and estimated costs of previous runs and other processes
+        self.persistent_cache = None
+        self.shared_cache_hits = 0
+        if persistent_cache_path is not None:
+            self._warm_start(persistent_cache_path)
+
+    def _warm_start(self, persistent_cache_path):
+        self.persistent_cache = PersistentCostCache(persistent_cache_path, database_fingerprint(self.db_connector))
+
+        # Plans are few and needed in every step, percentiles are looked up on demand
+        for query_text, plan in self.persistent_cache.load_plans().items():
+            self._cache_plan(query_text, plan)
+
+        logging.info(f"Warm-started cost evaluation with {len(self.cache)} plans from {persistent_cache_path}.")
+
     # def estimate_size(self, partition):
     #     # TODO: Refactor: It is currently too complicated to compute
     #     # We must search in current partitions to get an partition object with .hypopg_oid
@@ -102,15 +153,13 @@ class CostEvaluation:
         ), "Cost Evaluation is completed and cannot be reused."
         start_time = datetime.datetime.now()
 
-        filter(lambda x: not x.no_more_partitions, partitions)
         # self._prepare_cost_calculation(partitions, store_size=store_size)
         total_cost = 0
         plans = []
         costs = []
         for query in workload.queries:
             self.cost_requests += 1
-            cost1, plan = self._request_cache_plans(query, partitions)
-            cost = self.estimate_cost(plan, partitions)
+            cost, plan = self._request_cache_estimated_cost(query, partitions)
             total_cost += cost
             plans.append(plan)
             costs.append(cost)
@@ -120,6 +169,29 @@ class CostEvaluation:
 
         return total_cost, plans, costs
 
+    # Incremental variant of calculate_cost_and_plans after changed_partition was added to or removed from
+    # partitions: only queries on the partition's column are estimated again, the others keep their costs and plans.
+    def update_cost_and_plans(self, workload, partitions, changed_partition, total_cost, plans, costs):
+        assert (
+            self.completed is False
+        ), "Cost Evaluation is completed and cannot be reused."
+        start_time = datetime.datetime.now()
+
+        plans = list(plans)
+        costs = list(costs)
+        for query_index, query in enumerate(workload.queries):
+            if not self._query_partitions_mask(query) >> changed_partition.id & 1:
+                continue
+            self.cost_requests += 1
+            cost, plans[query_index] = self._request_cache_estimated_cost(query, partitions)
+            total_cost += cost - costs[query_index]
+            costs[query_index] = cost
+
+        end_time = datetime.datetime.now()
+        self.costing_time += end_time - start_time
+
+        return total_cost, plans, costs
+
     # Creates the current partition combination by simulating/creating
     # missing partitions and unsimulating/dropping partitions
     # that exist but are not in the combination.
@@ -155,32 +227,105 @@ class CostEvaluation:
         query_plan = self.db_connector.get_plan(query)
         return query_plan["Total Cost"], query_plan
 
+    # Fills the plan cache for all given queries whose plans are not cached yet.
+    # Missing plans are requested in batches instead of one round trip per query.
+    def prefetch_plans(self, queries):
+        missing_queries = {}
+        for query in queries:
+            if query.text in self.cache or query.text in missing_queries:
+                continue
+            if self.persistent_cache is not None:
+                plan = self.persistent_cache.lookup_plan(query.text)
+                if plan is not None:
+                    self.shared_cache_hits += 1
+                    self._cache_plan(query.text, plan)
+                    continue
+            missing_queries[query.text] = query
+
+        if len(missing_queries) == 0:
+            return
+
+        # Statements that need preparation, e.g., views, are planned by the connector one by one
+        batchable_queries = []
+        for query in missing_queries.values():
+            if "create view" in query.text.lower():
+                self._store_plan(query.text, self.db_connector.get_plan(query))
+            else:
+                batchable_queries.append(query)
+
+        if self.plan_fetcher is not None:
+            for query, plan in zip(batchable_queries, self.plan_fetcher.fetch_plans(batchable_queries)):
+                self._store_plan(query.text, plan)
+        else:
+            for batch_start in range(0, len(batchable_queries), EXPLAIN_BATCH_SIZE):
+                batch = batchable_queries[batch_start : batch_start + EXPLAIN_BATCH_SIZE]
+                for query, plan in zip(batch, self._get_plans_batched(batch)):
+                    self._store_plan(query.text, plan)
+
+        logging.debug(f"Prefetched {len(missing_queries)} plans.")
+
+    def _get_plans_batched(self, queries):
+        try:
+            if not self.explain_batch_function_created:
+                self.db_connector.exec_only(EXPLAIN_BATCH_FUNCTION)
+                self.explain_batch_function_created = True
+
+            query_texts = ", ".join(
+                ["'" + query.text.strip().rstrip(";").replace("'", "''") + "'" for query in queries]
+            )
+            rows = self.db_connector.exec_fetch(
+                f"SELECT pg_temp.swprl_explain_batch(ARRAY[{query_texts}]::text[]);", one=False
+            )
+            return [row[0][0]["Plan"] for row in rows]
+        except Exception as e:
+            logging.warning(f"Batched plan retrieval failed, falling back to single requests: {e}")
+            return [self.db_connector.get_plan(query) for query in queries]
+
+    # Adds plans and percentiles that were fetched elsewhere, e.g., by the prefetch thread of DBEnvV2
+    def add_prefetched(self, plans, percentiles):
+        for query_text, plan in plans.items():
+            if query_text not in self.cache:
+                self._cache_plan(query_text, plan)
+        for column, column_percentiles in percentiles.items():
+            if column not in self.cache_percentiles:
+                self.cache_percentiles[column] = column_percentiles
+
+    # Plans are cached as slim PlanNodes
+    def _cache_plan(self, query_text, plan):
+        plan = PlanNode.from_dict(plan)
+        self.cache[query_text] = (plan["Total Cost"], plan)
+        return self.cache[query_text]
+
+    def _store_plan(self, query_text, plan):
+        cost_plan = self._cache_plan(query_text, plan)
+        if self.persistent_cache is not None:
+            self.persistent_cache.store_plan(query_text, cost_plan[1].to_dict())
+        return cost_plan
+
+    # Entry counts, approximate bytes, and evictions of the bounded caches
+    def cache_info(self):
+        return {
+            "plans": self.cache.info(),
+            "estimated_costs": self.cache_estimated_costs.info(),
+            "intervals": self.cache_intervals.info(),
+        }
+
     def complete_cost_estimation(self):
         self.completed = True
 
+        if self.persistent_cache is not None:
+            self.persistent_cache.close()
+        if self.plan_fetcher is not None:
+            self.plan_fetcher.close()
+
         for partition in self.current_partitions.copy():
             self._unsimulate_or_drop_partition(partition)
 
         assert self.current_partitions == set()
 
     def _request_cache(self, query, partitions):
-        q_i_hash = (query, frozenset(partitions))
-        if q_i_hash in self.relevant_partitions_cache:
-            relevant_partitions = self.relevant_partitions_cache[q_i_hash]
-        else:
-            relevant_partitions = self._relevant_partitions(query, partitions)
-            self.relevant_partitions_cache[q_i_hash] = relevant_partitions
-
-        # Check if query and corresponding relevant partitions in cache
-        if (query, relevant_partitions) in self.cache:
-            self.cache_hits += 1
-            return self.cache[(query, relevant_partitions)]
-        # If no cache hit request cost from database system
-        else:
-            query_plan = self.db_connector.get_plan(query)
-            cost = self.estimate_cost(query_plan, relevant_partitions)
-            self.cache[(query, relevant_partitions)] = cost
-            return cost
+        cost, _ = self._request_cache_estimated_cost(query, partitions)
+        return cost
 
     def estimate_cost(self, query_plan, partitions):
 
@@ -222,10 +367,9 @@ class CostEvaluation:
                 unique_relevant_columns[partition.column].append(partition)
 
         for column in unique_relevant_columns:
-            percentiles = self._request_cache_percentiles(column)
-            percentiles = [p[0] for p in percentiles]
+            percentiles, percentiles_sorted = self._request_cache_percentile_values(column)
 
-            if not percentiles:
+            if len(percentiles) == 0:
                 return total_cost
 
             partitions = unique_relevant_columns[column]
@@ -234,109 +378,27 @@ class CostEvaluation:
             if column.is_date():
                 return self.estimate_costs_date(unique_relevant_columns[column][0], total_cost, intervals[column.name])
             else:
-                maximum_percentile_bound = 1
-                minimum_percentile_bound = 0
-                interval_value_min = None
-                interval_value_max = None
-
-                interval = intervals[column.name]
-                if column.is_numeric():
-                    if interval[0] is not None:
-                        try:
-                            interval_value_min = decimal.Decimal(interval[0])
-                        except:
-                            breakpoint()
-                    if interval[1] is not None:
-                        interval_value_max = decimal.Decimal(interval[1])
-                else:
-                    if interval[0] is not None:
-                        interval_value_min = interval[0]
-                    if interval[1] is not None:
-                        interval_value_max = interval[1]
-
-                total_partitions = 1
-                for partition in partitions:
-                    if partition.no_more_partitions:
-                        continue
-                    value = partition.upper_bound_value(percentiles)
-                    
-                    if interval_value_min is None:
-                        # < or <=
-                        if interval_value_max <= value:
-                            maximum_percentile_bound = partition.upper_bound
-                            break
-                        else:
-                            total_partitions += 1
-                    elif interval_value_max is None:
-                        # > or >=
-                        if interval_value_min <= value:
-                            minimum_percentile_bound = partition.upper_bound
-                        else:
-                            total_partitions = len(partitions)-partitions.index(partition)
-                            break
-                    else:
-                        try:
-                            if interval_value_min <= value and interval_value_max <= value:
-                                maximum_percentile_bound = partition.upper_bound
-                                break
-                            else:
-                                minimum_percentile_bound = partition.upper_bound
-                        except:
-                            breakpoint()
-                if total_partitions == 9:
-                    return total_cost*total_partitions
-                return total_cost*(maximum_percentile_bound-minimum_percentile_bound)*total_partitions
-
-    def get_interval(self, expression, interval):
-        op = expression[1]
-        if op == "AND" or op == "and":
-            *_, (e1,i1) = self.get_interval(expression[0], interval).items()
-            *_, (e2,i2) = self.get_interval(expression[2], interval).items()
-            if e1 == e2:
-                interval[e1] = utils.intersect_intervals(i1, i2)
-            else:
-                interval[e1] = i1
-                interval[e2] = i2
-        elif op == "OR" or op == "or":
-            *_, (e1,i1) = self.get_interval(expression[0], interval).items()
-            *_, (e2,i2) = self.get_interval(expression[2], interval).items()
-            if e1 == e2:
-                interval[e1] = utils.union_intervals(i1, i2)
-            else:
-                interval[e1] = i1
-                interval[e2] = i2
-        else:
-            (e,i) = self._interval(expression)
-            if (isinstance(e,list)):
-                breakpoint()
-            interval[e.lower()]=i
-
-        return interval
-
-    def get_interval_any(self, expression):
-        e = expression[0]
-        expressions = expression[3:]
-        expressions.sort()
-
-        intervals = {}
-        intervals[e.lower()] = (f"'{expressions[0]}'", f"'{expressions[-1]}'")
-        return intervals
-
-
-            
-    def _interval(self, expression):
-        op = expression[1]
-        val = expression[2]
-        if isinstance(val, str) and ((val.startswith('"') and val.endswith('"')) or (val.startswith("'") and val.endswith("'"))):
-            val = val[1:-1]
-        if op == "=":
-            return (expression[0], (val,val))
-        elif op == "<" or op == "<=":
-            return (expression[0], (None,val))
-        elif op == ">" or op == ">=":
-            return (expression[0], (val, None))
-        else:
-            raise NotImplementedError(f"Operator not supported - {op}")
+                interval = self._typed_interval(column, intervals[column.name])
+                if interval is None:
+                    return total_cost
+                selection, more_partitions = range_pruning.decile_selection(partitions)
+                costs = range_pruning.range_pruning_costs(
+                    total_cost, percentiles, percentiles_sorted, interval, selection, more_partitions
+                )
+                return float(costs[0])
+
+    # Interval values in the type of the column's percentile values, None if the interval cannot prune
+    @staticmethod
+    def _typed_interval(column, interval):
+        if interval[0] is None and interval[1] is None:
+            return None
+        try:
+            if column.is_numeric():
+                return tuple(None if value is None else float(value) for value in interval)
+            return tuple(None if value is None else str(value) for value in interval)
+        except (TypeError, ValueError):
+            logging.debug(f"Interval {interval} does not match the type of column {column.name}")
+            return None
 
     def estimate_costs_date(self, partition, total_cost, interval):
         if partition.no_more_partitions:
@@ -386,44 +448,86 @@ class CostEvaluation:
     def _request_cache_percentiles(self, column):
         if column in self.cache_percentiles:
             return self.cache_percentiles[column]
-        else:
+
+        percentiles = None
+        if self.persistent_cache is not None:
+            column_key = f"{column.table.name}.{column.name}"
+            percentiles = self.persistent_cache.lookup_percentiles(column_key)
+            if percentiles is not None:
+                self.shared_cache_hits += 1
+        if percentiles is None:
             percentiles = self.db_connector.get_column_percentiles(column)
-            self.cache_percentiles[column] = percentiles
-            return percentiles
+            if self.persistent_cache is not None:
+                self.persistent_cache.store_percentiles(column_key, percentiles)
+        self.cache_percentiles[column] = percentiles
+        return percentiles
+
+    # Percentile values as a typed array and whether they are sorted, see range_pruning
+    def _request_cache_percentile_values(self, column):
+        if column in self.cache_percentile_values:
+            return self.cache_percentile_values[column]
+
+        values = range_pruning.percentile_values(self._request_cache_percentiles(column), column.is_numeric())
+        self.cache_percentile_values[column] = (values, range_pruning.is_sorted(values))
+        return self.cache_percentile_values[column]
         
     def _request_cache_intervals(self, query_filter):
         if query_filter in self.cache_intervals:
             return self.cache_intervals[query_filter]
         else:
-            parsed_expression = self.expression_parser.parse(query_filter)[0]
-            if parsed_expression[2] == "any":
-                intervals = self.get_interval_any(parsed_expression)
-            else:
-                intervals = self.get_interval(parsed_expression.asList(), {})
+            intervals = self.expression_parser.intervals(query_filter)
             self.cache_intervals[query_filter] = intervals
             return intervals
 
-    def _request_cache_plans(self, query, partitions):
-        q_i_hash = (query, frozenset(partitions))
-        if q_i_hash in self.relevant_partitions_cache:
-            relevant_partitions = self.relevant_partitions_cache[q_i_hash]
-        else:
-            relevant_partitions = self._relevant_partitions(query, partitions)
-            self.relevant_partitions_cache[q_i_hash] = relevant_partitions
-
-        # Check if query and corresponding relevant partitions in cache
-        if (query, relevant_partitions) in self.cache:
+    def _request_cache_plans(self, query):
+        # Check if query in cache
+        if query.text in self.cache:
             self.cache_hits += 1
-            return self.cache[(query, relevant_partitions)]
-        # If no cache hit request cost from database system
-        else:
-            cost, plan = self._get_cost_plan(query)
-            self.cache[(query, relevant_partitions)] = (cost, plan)
-            return cost, plan
+            return self.cache[query.text]
+        # Check if another process already requested the plan
+        if self.persistent_cache is not None:
+            plan = self.persistent_cache.lookup_plan(query.text)
+            if plan is not None:
+                self.shared_cache_hits += 1
+                return self._cache_plan(query.text, plan)
+        # If no cache hit request plan from database system
+        _, plan = self._get_cost_plan(query)
+        return self._store_plan(query.text, plan)
+
+    def _request_cache_estimated_cost(self, query, partitions):
+        relevant_partitions = self._relevant_partitions(query, self._partitions_bitmask(partitions))
+
+        _, plan = self._request_cache_plans(query)
+        cost = self._request_cache_estimated_cost_from_plan(query, plan, relevant_partitions)
+
+        return cost, plan
+
+    def _request_cache_estimated_cost_from_plan(self, query, plan, relevant_partitions):
+        self.estimated_cost_requests += 1
+        cost_hash = (query.text, relevant_partitions)
+        if cost_hash in self.cache_estimated_costs:
+            self.estimated_cost_hits += 1
+            return self.cache_estimated_costs[cost_hash]
+
+        # Estimates are cheaper to recompute than to look up in the shared cache, hence, they stay in this process
+        partitions = utils.partitions_from_bitmask(relevant_partitions, self.all_partitions_flat)
+        cost = self.estimate_cost(plan, partitions)
+        self.cache_estimated_costs[cost_hash] = cost
+        return cost
 
     @staticmethod
-    def _relevant_partitions(query, partitions):
-        relevant_partitions = [
-            x for x in partitions if x.column in query.columns
-        ]
-        return frozenset(relevant_partitions)
+    def _partitions_bitmask(partitions):
+        if isinstance(partitions, int):
+            return partitions
+        return utils.partitions_to_bitmask(partitions)
+
+    def _relevant_partitions(self, query, partitions_bitmask):
+        return partitions_bitmask & self._query_partitions_mask(query)
+
+    def _query_partitions_mask(self, query):
+        if query.text not in self.query_partition_masks:
+            assert self.all_partitions_flat is not None, "Partition bitmasks require all_partitions_flat."
+            self.query_partition_masks[query.text] = utils.partitions_to_bitmask(
+                [x for x in self.all_partitions_flat if x.column in query.columns]
+            )
+        return self.query_partition_masks[query.text]
@@ -22,16 +22,17 @@ def which_queries_to_remove(plans, queries_to_remove, seed=None, excluded_query_
         relevant_operators_with_partitions.append(boo)
         all_operators |= set(boo)
 
-    idx_without_removals = []
-    for idx, (op_wo, op_with) in enumerate(zip(relevant_operators_wo_partitions, relevant_operators_with_partitions)):
-        operators_combined = set(op_wo) | set(op_with)
+    # The operators of every query are combined once instead of in every sampling iteration
+    operators_per_query = [
+        frozenset(op_wo) | frozenset(op_with)
+        for op_wo, op_with in zip(relevant_operators_wo_partitions, relevant_operators_with_partitions)
+    ]
 
-        operators_without_q = set()
-        for idx2, (op_wo, op_with) in enumerate(zip(relevant_operators_wo_partitions, relevant_operators_with_partitions)):
-            if idx2 == idx:
-                continue
-            operators_without_q |= set(op_wo)
-            operators_without_q |= set(op_with)
+    idx_without_removals = []
+    for idx, operators_combined in enumerate(operators_per_query):
+        operators_without_q = set().union(
+            *[operators for idx2, operators in enumerate(operators_per_query) if idx2 != idx]
+        )
 
         operators_exclusive_to_q = all_operators - operators_without_q
         operators_exclusive_to_q_2 = operators_combined - operators_without_q
@@ -45,12 +46,8 @@ def which_queries_to_remove(plans, queries_to_remove, seed=None, excluded_query_
     if queries_to_remove <= len(idx_without_removals):
         for i in range(10_000):
             remove = random.sample(idx_without_removals, queries_to_remove)
-            new_ops = set()
-            for idx, (op_wo, op_with) in enumerate(zip(relevant_operators_wo_partitions, relevant_operators_with_partitions)):
-                if idx in remove:
-                    continue
-                operators_combined = set(op_wo) | set(op_with)
-                new_ops |= operators_combined
+            removed = frozenset(remove)
+            new_ops = set().union(*[operators for idx, operators in enumerate(operators_per_query) if idx not in removed])
             if len(all_operators - new_ops) == 0:
                 for idx in range(len(remove)):
                     # Query classes start with 1
@@ -66,12 +63,8 @@ def which_queries_to_remove(plans, queries_to_remove, seed=None, excluded_query_
     # Magic, high number
     for i in range(50_000):
         remove = random.sample(all_idx - zero_indexed_excluded, queries_to_remove)
-        new_ops = set()
-        for idx, (op_wo, op_with) in enumerate(zip(relevant_operators_wo_partitions, relevant_operators_with_partitions)):
-            if idx in remove:
-                continue
-            operators_combined = set(op_wo) | set(op_with)
-            new_ops |= operators_combined
+        removed = frozenset(remove)
+        new_ops = set().union(*[operators for idx, operators in enumerate(operators_per_query) if idx not in removed])
         if len(new_ops) > current_best_sample["unique_operators"]:
             current_best_sample["unique_operators"] = len(new_ops)
             current_best_sample["indices"] = remove
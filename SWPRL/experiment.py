@@ -1,5 +1,6 @@
 import datetime
 import gzip
+import hashlib
 import importlib
 import json
 import logging
@@ -15,9 +16,11 @@ from gym_db.common import EnvironmentType
 from index_selection_evaluation.selection.algorithms.db2advis_algorithm import DB2AdvisAlgorithm
 from index_selection_evaluation.selection.algorithms.extend_algorithm import ExtendAlgorithm
 from index_selection_evaluation.selection.dbms.postgres_dbms import PostgresDatabaseConnector
+from index_selection_evaluation.selection.utils import b_to_mb
 
 from . import utils
 from .configuration_parser import ConfigurationParser
+from .replay_connector import ConnectorFactory
 from .schema import Schema
 from .workload_generator import WorkloadGenerator
 
@@ -32,6 +35,7 @@ class Experiment(object):
 
         self.id = self.config["id"]
         self.model = None
+        self.connector_factory = ConnectorFactory(**self.config["database_connector"])
 
         self.rnd = random.Random()
         self.rnd.seed(self.config["random_seed"])
@@ -63,6 +67,7 @@ class Experiment(object):
             self.config["workload"]["benchmark"],
             self.config["workload"]["scale_factor"],
             self.config["column_filters"],
+            connector_factory=self.connector_factory,
         )
 
         self.workload_generator = WorkloadGenerator(
@@ -71,6 +76,7 @@ class Experiment(object):
             random_seed=self.config["random_seed"],
             database_name=self.schema.database_name,
             experiment_id=self.id,
+            connector_factory=self.connector_factory,
         )
         self._pickle_workloads()
 
@@ -86,22 +92,64 @@ class Experiment(object):
         logging.info(f"Feeding {len(self.globally_partitionable_columns_flat)} candidates into the environments.")
 
         if "workload_embedder" in self.config:
-            workload_embedder_class = getattr(
-                importlib.import_module("SWPRL.workload_embedder"), self.config["workload_embedder"]["type"]
-            )
-            workload_embedder_connector = PostgresDatabaseConnector(self.schema.database_name, autocommit=True)
-            self.workload_embedder = workload_embedder_class(
-                self.workload_generator.query_texts,
-                self.config["workload_embedder"]["representation_size"],
-                workload_embedder_connector,
-                self.globally_partitionable_columns_flat, 
-            )
+            self.workload_embedder = self._load_or_create_workload_embedder()
 
         self.multi_validation_wl = []
         if len(self.workload_generator.wl_validation) > 1:
             for workloads in self.workload_generator.wl_validation:
                 self.multi_validation_wl.extend(self.rnd.sample(workloads, min(7, len(workloads))))
 
+    # The fitted embedder is pickled into the experiment folder. Later runs with the same inputs, e.g., loading
+    # the experiment, reuse it instead of retrieving the plans and training it again.
+    def _load_or_create_workload_embedder(self):
+        embedder_path = self._workload_embedder_path()
+        if os.path.isfile(embedder_path):
+            with gzip.open(embedder_path, "rb") as handle:
+                workload_embedder = pickle.load(handle)
+            workload_embedder.plan_embedding_cache.set_limits(self.config["cache_limits"].get("plan_embeddings"))
+            logging.info(f"Loaded the workload embedder from {embedder_path}.")
+            return workload_embedder
+
+        workload_embedder_class = getattr(
+            importlib.import_module("SWPRL.workload_embedder"), self.config["workload_embedder"]["type"]
+        )
+        workload_embedder_connector = self.connector_factory(self.schema.database_name, autocommit=True)
+        # Further keys are options of the specific embedder, e.g., number_of_features
+        workload_embedder_options = {
+            key: value
+            for key, value in self.config["workload_embedder"].items()
+            if key not in ["type", "representation_size"]
+        }
+        workload_embedder = workload_embedder_class(
+            self.workload_generator.query_texts,
+            self.config["workload_embedder"]["representation_size"],
+            workload_embedder_connector,
+            self.globally_partitionable_columns_flat,
+            persistent_cost_cache=self.config["persistent_cost_cache"],
+            cache_limits=self.config["cache_limits"],
+            **workload_embedder_options,
+        )
+        self._pickle_workload_embedder(workload_embedder)
+        return workload_embedder
+
+    # Embedders are identified by their configuration, the query texts, and the schema's partitionable columns
+    def _workload_embedder_path(self):
+        embedder_inputs = [
+            self.config["workload_embedder"],
+            self.schema.database_name,
+            self.workload_generator.query_texts,
+            [
+                (column.table.name, column.name, str(getattr(column, "type", None)))
+                for column in self.globally_partitionable_columns_flat
+            ],
+        ]
+        embedder_hash = hashlib.sha1(json.dumps(embedder_inputs, sort_keys=True).encode("utf-8")).hexdigest()
+        return f"{self.experiment_folder_path}/workload_embedder_{embedder_hash}.pickle.gzip"
+
+    def _pickle_workload_embedder(self, workload_embedder):
+        with gzip.open(self._workload_embedder_path(), "wb") as handle:
+            pickle.dump(workload_embedder, handle, protocol=pickle.HIGHEST_PROTOCOL)
+
     def _pickle_workloads(self):
         with open(f"{self.experiment_folder_path}/testing_workloads.pickle", "wb") as handle:
             pickle.dump(self.workload_generator.wl_testing, handle, protocol=pickle.HIGHEST_PROTOCOL)
@@ -178,6 +226,13 @@ class Experiment(object):
 
         self.model.save(f"{self.experiment_folder_path}/final_model")
         training_env.save(f"{self.experiment_folder_path}/vec_normalize.pkl")
+        # Includes the plan embeddings cached in this process, e.g., by vectorized environments
+        if "workload_embedder" in self.config:
+            self._pickle_workload_embedder(self.workload_embedder)
+
+        # Environment processes may be terminated before their recording connectors save on exit
+        if self.config["gym_version"] == 2:
+            training_env.env_method("save_database_responses")
 
         self.evaluated_episodes = 0
         for number_of_resets in training_env.get_attr("number_of_resets"):
@@ -190,13 +245,33 @@ class Experiment(object):
         self.cache_hits = 0
         self.cost_requests = 0
         self.costing_time = datetime.timedelta(0)
+        self.estimated_cost_hits = 0
+        self.estimated_cost_requests = 0
+        self.shared_cache_hits = 0
+        self.cache_sizes = {}
+        self.transition_hits = 0
+        self.transition_requests = 0
         for cache_info in training_env.env_method("get_cost_eval_cache_info"):
             self.cache_hits += cache_info[1]
             self.cost_requests += cache_info[0]
             self.costing_time += cache_info[2]
-        self.costing_time /= self.config["parallel_environments"]
+            self.estimated_cost_requests += cache_info[3]
+            self.estimated_cost_hits += cache_info[4]
+            self.shared_cache_hits += cache_info[5]
+            for name, info in cache_info[6].items():
+                if name not in self.cache_sizes:
+                    self.cache_sizes[name] = {"entries": 0, "bytes": 0, "evictions": 0}
+                for key in self.cache_sizes[name]:
+                    self.cache_sizes[name][key] += info[key]
+            if "transitions" in cache_info[6]:
+                self.transition_hits += cache_info[6]["transitions"]["hits"]
+                self.transition_requests += cache_info[6]["transitions"]["requests"]
+        # Vectorized environments share one cost evaluation that is only reported once
+        if not self.config["vectorized_environment"]:
+            self.costing_time /= self.config["parallel_environments"]
 
         self.cache_hit_ratio = self.cache_hits / self.cost_requests * 100
+        self.estimated_cost_hit_ratio = self.estimated_cost_hits / max(self.estimated_cost_requests, 1) * 100
 
         if self.config["pickle_cost_estimation_caches"]:
             caches = []
@@ -447,6 +522,26 @@ class Experiment(object):
                     f"{self.cache_hit_ratio:.2f} ({self.cache_hits} of {self.cost_requests})\n"
                 )
             )
+            f.write(
+                (
+                    f"Estimated cost hit ratio:      "
+                    f"{self.estimated_cost_hit_ratio:.2f} ({self.estimated_cost_hits} of {self.estimated_cost_requests})\n"
+                )
+            )
+            f.write(f"Shared cost cache hits:        {self.shared_cache_hits}\n")
+            for name, info in self.cache_sizes.items():
+                f.write(
+                    f"Cache {name + ':':<24}{info['entries']} entries, {b_to_mb(info['bytes']):.2f} MB, "
+                    f"{info['evictions']} evictions\n"
+                )
+            if self.config["transition_cache"] is not None:
+                transition_hit_ratio = self.transition_hits / max(self.transition_requests, 1) * 100
+                f.write(
+                    (
+                        f"Transition hit ratio:          "
+                        f"{transition_hit_ratio:.2f} ({self.transition_hits} of {self.transition_requests})\n"
+                    )
+                )
             training_time = self.training_end_time - self.training_start_time
             f.write(
                 f"Cost eval time (% of total):   {self.costing_time} ({self.costing_time / training_time * 100:.2f}%)\n"
@@ -612,66 +707,10 @@ class Experiment(object):
 
     def make_env(self, env_id, environment_type=EnvironmentType.TRAINING, workloads_in=None):
         def _init():
-            action_manager_class = getattr(
-                importlib.import_module("SWPRL.action_manager"), self.config["action_manager"]
-            )
-            action_manager = action_manager_class(
-                partitionable_columns=self.globally_partitionable_columns,
-                sb_version=self.config["rl_algorithm"]["stable_baselines_version"],
-                all_partitions=self.all_partitions,
-            )
-
-            if self.number_of_actions is None:
-                self.number_of_actions = action_manager.number_of_actions
-
-            observation_manager_config = {
-                "number_of_query_classes": self.workload_generator.number_of_query_classes,
-                "workload_embedder": self.workload_embedder if "workload_embedder" in self.config else None,
-                "workload_size": self.workload_size
-            }
-            observation_manager_class = getattr(
-                importlib.import_module("SWPRL.observation_manager"), self.config["observation_manager"]
-            )
-            observation_manager = observation_manager_class(
-                action_manager.number_of_actions, observation_manager_config
-            )
-
-            if self.number_of_features is None:
-                self.number_of_features = observation_manager.number_of_features
-
-            reward_calculator_class = getattr(
-                importlib.import_module("SWPRL.reward_calculator"), self.config["reward_calculator"]
-            )
-            reward_calculator = reward_calculator_class()
-
-            if environment_type == EnvironmentType.TRAINING:
-                workloads = self.workload_generator.wl_training if workloads_in is None else workloads_in
-            elif environment_type == EnvironmentType.TESTING:
-                # Selecting the hardest workload by default
-                workloads = self.workload_generator.wl_testing[-1] if workloads_in is None else workloads_in
-            elif environment_type == EnvironmentType.VALIDATION:
-                # Selecting the hardest workload by default
-                workloads = self.workload_generator.wl_validation[-1] if workloads_in is None else workloads_in
-            else:
-                raise ValueError
-
             env = gym.make(
                 f"DB-v{self.config['gym_version']}",
                 environment_type=environment_type,
-                config={
-                    "database_name": self.schema.database_name,
-                    "globally_partitionable_columns_flat": self.globally_partitionable_columns_flat,
-                    "all_partitions": self.all_partitions,
-                    "all_partitions_flat": action_manager.all_partitions_flat,
-                    "workloads": workloads,
-                    "random_seed": self.config["random_seed"] + env_id,
-                    "max_steps_per_episode": self.config["max_steps_per_episode"],
-                    "action_manager": action_manager,
-                    "observation_manager": observation_manager,
-                    "reward_calculator": reward_calculator,
-                    "env_id": env_id,
-                    "similar_workloads": self.config["workload"]["similar_workloads"],
-                },
+                config=self._make_env_config(env_id, environment_type, workloads_in),
             )
             return env
 
@@ -679,6 +718,95 @@ class Experiment(object):
 
         return _init
 
+    # Steps all environments in this process with a shared cost evaluation, see DBVecEnvV2
+    def make_vec_env(self, number_of_envs, environment_type=EnvironmentType.TRAINING, workloads_in=None):
+        from gym_db.envs.db_vec_env_v2 import DBVecEnvV2
+
+        assert self.config["gym_version"] == 2, "Vectorized environments are only available for DB-v2."
+        self.set_random_seed(self.config["random_seed"])
+
+        configs = [
+            self._make_env_config(env_id, environment_type, workloads_in) for env_id in range(number_of_envs)
+        ]
+        return DBVecEnvV2(configs, environment_type=environment_type)
+
+    def _make_env_config(self, env_id, environment_type, workloads_in):
+        action_manager_class = getattr(
+            importlib.import_module("SWPRL.action_manager"), self.config["action_manager"]
+        )
+        action_manager = action_manager_class(
+            partitionable_columns=self.globally_partitionable_columns,
+            sb_version=self.config["rl_algorithm"]["stable_baselines_version"],
+            all_partitions=self.all_partitions,
+        )
+
+        if self.number_of_actions is None:
+            self.number_of_actions = action_manager.number_of_actions
+
+        observation_manager_config = {
+            "number_of_query_classes": self.workload_generator.number_of_query_classes,
+            "workload_embedder": self.workload_embedder if "workload_embedder" in self.config else None,
+            "workload_size": self.workload_size,
+            "observation_dtype": self.config["observation_dtype"],
+        }
+        observation_manager_class = getattr(
+            importlib.import_module("SWPRL.observation_manager"), self.config["observation_manager"]
+        )
+        observation_manager = observation_manager_class(
+            action_manager.number_of_actions, observation_manager_config
+        )
+
+        if self.number_of_features is None:
+            self.number_of_features = observation_manager.number_of_features
+
+        reward_calculator_class = getattr(
+            importlib.import_module("SWPRL.reward_calculator"), self.config["reward_calculator"]
+        )
+        reward_calculator = reward_calculator_class()
+
+        if environment_type == EnvironmentType.TRAINING:
+            workloads = self.workload_generator.wl_training if workloads_in is None else workloads_in
+        elif environment_type == EnvironmentType.TESTING:
+            # Selecting the hardest workload by default
+            workloads = self.workload_generator.wl_testing[-1] if workloads_in is None else workloads_in
+        elif environment_type == EnvironmentType.VALIDATION:
+            # Selecting the hardest workload by default
+            workloads = self.workload_generator.wl_validation[-1] if workloads_in is None else workloads_in
+        else:
+            raise ValueError
+
+        return {
+            "database_name": self.schema.database_name,
+            "globally_partitionable_columns_flat": self.globally_partitionable_columns_flat,
+            "all_partitions": self.all_partitions,
+            "all_partitions_flat": action_manager.all_partitions_flat,
+            "workloads": workloads,
+            "random_seed": self.config["random_seed"] + env_id,
+            "max_steps_per_episode": self.config["max_steps_per_episode"],
+            "action_manager": action_manager,
+            "observation_manager": observation_manager,
+            "reward_calculator": reward_calculator,
+            "env_id": env_id,
+            "similar_workloads": self.config["workload"]["similar_workloads"],
+            "persistent_cost_cache": self._shared_cost_cache_path(),
+            "plan_fetch_concurrency": self.config["plan_fetch_concurrency"],
+            "cache_limits": self.config["cache_limits"],
+            "transition_cache": self.config["transition_cache"],
+            "connector_factory": self.connector_factory,
+            "prefetch_next_workload": self.config["prefetch_next_workload"],
+        }
+
+    # Parallel environments share their plans and percentiles through the persistent cache file, estimated costs
+    # stay in every environment's memory.
+    # If persistence is disabled, a cache file local to the experiment folder is used.
+    # Vectorized environments share their caches in memory.
+    def _shared_cost_cache_path(self):
+        if self.config["persistent_cost_cache"] is not None:
+            return self.config["persistent_cost_cache"]
+        if self.config["parallel_environments"] > 1 and not self.config["vectorized_environment"]:
+            return f"{self.experiment_folder_path}/shared_cost_cache.sqlite"
+        return None
+
     def _set_sb_version_specific_methods(self):
         if self.config["rl_algorithm"]["stable_baselines_version"] == 2:
             from stable_baselines.common import set_global_seeds as set_global_seeds_sb2
@@ -1,100 +1,337 @@
-import pyparsing as pp
 import logging
+import re
 
-from pyparsing import (
-    Word,
-    delimitedList,
-    Optional,
-    Group,
-    alphas,
-    alphanums,
-    Forward,
-    oneOf,
-    quotedString,
-    infixNotation,
-    opAssoc,
-    restOfLine,
-    CaselessKeyword,
-    ParserElement,
-    ParseResults,
-    pyparsing_common as ppc,
+from . import utils
+
+# Single-pass tokenizer for the Filter/Index Cond expressions of PostgreSQL's EXPLAIN output
+TOKEN_REGEX = re.compile(
+    r"""
+    (?P<whitespace>\s+)
+    |(?P<string>'(?:[^']|'')*')
+    |(?P<quoted_identifier>"(?:[^"]|"")*")
+    |(?P<number>\d+(?:\.\d*)?(?:[eE][+-]?\d+)?|\.\d+(?:[eE][+-]?\d+)?)
+    |(?P<identifier>[A-Za-z_][A-Za-z0-9_$]*)
+    |(?P<cast>::)
+    |(?P<punctuation>[(),.\[\]])
+    |(?P<operator>[<>=!~*+\-/%|&^#@?]+)
+    """,
+    re.VERBOSE,
+)
+
+COMPARISON_OPERATORS = frozenset(["=", "<", "<=", ">", ">=", "<>", "!=", "~~", "!~~", "~~*", "!~~*"])
+# Type names of casts may consist of several words
+TYPE_NAME_CONTINUATIONS = frozenset(["without", "with", "time", "zone", "varying", "precision"])
+FLIPPED_OPERATORS = {"<": ">", "<=": ">=", ">": "<", ">=": "<=", "=": "="}
+# Elements of array literals of these types are compared as numbers, all others as strings
+NUMERIC_TYPES = frozenset(
+    ["smallint", "integer", "int", "bigint", "int2", "int4", "int8", "numeric", "decimal", "real", "double", "float4", "float8"]
 )
 
+
+class ExpressionParseError(Exception):
+    pass
+
+
+# Recursive descent parser that translates a filter expression into value intervals per column:
+# {column_name: (minimum, maximum)}, where None denotes an open bound.
+# Unsupported syntax yields no pruning information, i.e., an empty dictionary, or drops only the
+# affected conditions.
 class ExpressionParser:
-    def __init__(self):
-        ParserElement.enablePackrat()
-
-        # define SQL tokens
-        selectStmt = Forward()
-        whereStmt = Forward()
-        SELECT, FROM, WHERE, AND, OR, IN, IS, NOT, NULL, ANY = map(
-            CaselessKeyword, "select from where and or in is not null any".split()
-        )
-        NOT_NULL = NOT + NULL
-
-        ident = Word(alphas, alphanums + "_$").setName("identifier")
-        columnName = delimitedList(ident, ".", combine=True).setName("column name")
-        columnName.addParseAction(ppc.upcaseTokens)
-        columnNameList = Group(delimitedList(columnName).setName("column_list"))
-        tableName = delimitedList(ident, ".", combine=True).setName("table name")
-        tableName.addParseAction(ppc.upcaseTokens)
-        tableNameList = Group(delimitedList(tableName).setName("table_list"))
-
-        binop = oneOf("= != < > >= <= eq ne lt le gt ge", caseless=True).setName("binop")
-        realNum = ppc.real().setName("real number")
-        intNum = ppc.signed_integer()
-        types = oneOf("bpchar text date timestamp interval numeric bigint text[]")
-        delimitor = oneOf("::")
-        value = quotedString + delimitor.suppress() + types.suppress()
-        left_para = oneOf("(")
-        right_para = oneOf(")")
-        left_para_array = oneOf("('{")
-        right_para_array = oneOf("}'")
-
-        columnRval = (
-            realNum | intNum | value | columnName | left_para.suppress() + columnName + right_para.suppress() + delimitor.suppress() + types.suppress()
-        ).setName("column_rvalue")  # need to add support for alg expressions
-        whereCondition = Group(
-            (columnName + binop + columnRval)
-            | (left_para.suppress() + columnName + right_para.suppress() + delimitor.suppress() + types.suppress() + binop + ANY + (left_para_array.suppress() + delimitedList(columnRval).setName("any_values_list") + right_para_array.suppress() + delimitor.suppress() + types.suppress() + right_para.suppress()))
-            | (left_para.suppress() + columnName + right_para.suppress() + delimitor.suppress() + types.suppress() + binop + columnRval)
-            | (columnName + IN + Group("(" + delimitedList(columnRval).setName("in_values_list") + ")"))
-            | (columnName + IN + Group("(" + selectStmt + ")"))
-            | (columnName + IS + (NULL | NOT_NULL))
-        ).setName("where_condition")
-
-        whereExpression = infixNotation(
-            whereCondition,
-            [
-                (NOT, 1, opAssoc.RIGHT),
-                (AND, 2, opAssoc.LEFT),
-                (OR, 2, opAssoc.LEFT),
-            ],
-        ).setName("where_expression")
-
-        # define the grammar
-        # selectStmt <<= (
-        #     SELECT
-        #     + ("*" | columnNameList)("columns")
-        #     + FROM
-        #     + tableNameList("tables")
-        #     + Optional(Group(WHERE + whereExpression), "")("where")
-        # ).setName("select_statement")
-
-        whereStmt <<= (
-            (left_para.suppress() + whereExpression + right_para.suppress()) | whereExpression
-        ).setName("where_statement")
-
-        self.parser = whereStmt
-
-        # define comment format, and ignore them
-        SqlComment = "--" + restOfLine
-        self.parser.ignore(SqlComment)
-
-    def parse(self, expression):
+    def intervals(self, expression):
         try:
-            return self.parser.parseString(expression, parseAll=True)
-        except pp.ParseException as e:
-            logging.error(f"Error parsing expression: {e} - {expression}")
-            breakpoint()
-            return None
\ No newline at end of file
+            self._tokenize(expression)
+            node = self._parse_or()
+            if self.position != len(self.tokens):
+                raise ExpressionParseError(f"Unexpected token {self.tokens[self.position][1]}")
+            intervals = self._intervals(node)
+        except (ExpressionParseError, TypeError) as e:
+            logging.debug(f"No pruning information for expression: {e} - {expression}")
+            return {}
+
+        return intervals
+
+    def _tokenize(self, expression):
+        self.tokens = []
+        self.position = 0
+
+        position = 0
+        while position < len(expression):
+            match = TOKEN_REGEX.match(expression, position)
+            if match is None:
+                raise ExpressionParseError(f"Unexpected character {expression[position]}")
+            position = match.end()
+
+            kind = match.lastgroup
+            value = match.group(kind)
+            if kind == "whitespace":
+                continue
+            if kind == "identifier":
+                value = value.lower()
+            elif kind == "quoted_identifier":
+                kind = "identifier"
+                value = value[1:-1].replace('""', '"').lower()
+            elif kind == "string":
+                value = value[1:-1].replace("''", "'")
+            self.tokens.append((kind, value))
+
+    def _peek(self, offset=0):
+        if self.position + offset < len(self.tokens):
+            return self.tokens[self.position + offset]
+        return (None, None)
+
+    def _next(self):
+        token = self._peek()
+        if token[0] is None:
+            raise ExpressionParseError("Unexpected end of expression")
+        self.position += 1
+        return token
+
+    def _expect(self, value):
+        token = self._next()
+        if token[1] != value:
+            raise ExpressionParseError(f"Expected {value} but found {token[1]}")
+
+    def _is_keyword(self, keyword, offset=0):
+        kind, value = self._peek(offset)
+        return kind == "identifier" and value == keyword
+
+    # Grammar, from lowest to highest precedence:
+    # or         := and (OR and)*
+    # and        := not (AND not)*
+    # not        := NOT not | comparison
+    # comparison := operand [operator (operand | (ANY | ALL) operand) | IN list | IS [NOT] NULL]
+    # operand    := (literal | column | function | '(' or ')') ['::' type]*
+    def _parse_or(self):
+        children = [self._parse_and()]
+        while self._is_keyword("or"):
+            self._next()
+            children.append(self._parse_and())
+        return children[0] if len(children) == 1 else ("or", children)
+
+    def _parse_and(self):
+        children = [self._parse_not()]
+        while self._is_keyword("and"):
+            self._next()
+            children.append(self._parse_not())
+        return children[0] if len(children) == 1 else ("and", children)
+
+    def _parse_not(self):
+        if self._is_keyword("not"):
+            self._next()
+            return ("not", self._parse_not())
+        return self._parse_comparison()
+
+    def _parse_comparison(self):
+        left = self._parse_operand()
+
+        kind, value = self._peek()
+        if kind == "operator" and value in COMPARISON_OPERATORS:
+            self._next()
+            if self._is_keyword("any") or self._is_keyword("some"):
+                self._next()
+                return ("any", value, left, self._array_values(self._parse_operand()))
+            if self._is_keyword("all"):
+                self._next()
+                self._parse_operand()
+                return ("unsupported",)
+            return ("comparison", value, left, self._parse_operand())
+        if self._is_keyword("in"):
+            self._next()
+            return ("any", "=", left, self._parse_list())
+        if self._is_keyword("not") and self._is_keyword("in", 1):
+            self._next()
+            self._next()
+            self._parse_list()
+            return ("unsupported",)
+        if self._is_keyword("is"):
+            self._next()
+            if self._is_keyword("not"):
+                self._next()
+            self._expect("null")
+            return ("unsupported",)
+
+        return left
+
+    def _parse_operand(self):
+        kind, value = self._next()
+
+        if kind == "string":
+            node = ("literal", value)
+        elif kind == "number":
+            node = ("literal", self._number(value))
+        elif kind == "operator" and value == "-" and self._peek()[0] == "number":
+            node = ("literal", -self._number(self._next()[1]))
+        elif kind == "identifier" and value == "array" and self._peek()[1] == "[":
+            node = ("array", self._parse_list(opening="[", closing="]"))
+        elif kind == "identifier":
+            name = value
+            while self._peek()[1] == "." and self._peek(1)[0] == "identifier":
+                self._next()
+                name += f".{self._next()[1]}"
+            if self._peek()[1] == "(":
+                # Function calls, e.g., lower(column), provide no pruning information
+                self._parse_list()
+                node = ("unsupported",)
+            else:
+                node = ("column", name)
+        elif value == "(":
+            node = self._parse_or()
+            self._expect(")")
+        else:
+            raise ExpressionParseError(f"Unexpected token {value}")
+
+        while self._peek()[0] == "cast":
+            self._next()
+            type_name, is_array = self._parse_type()
+            # Array literals, e.g., '{9,10,11}'::integer[], are split into elements of the cast's type
+            if is_array and node[0] == "literal" and isinstance(node[1], str):
+                node = ("array", [("literal", element) for element in self._array_literal_elements(node[1], type_name)])
+
+        return node
+
+    # Returns the type's first word and whether it is an array type
+    def _parse_type(self):
+        kind, type_name = self._next()
+        if kind != "identifier":
+            raise ExpressionParseError("Expected type name after ::")
+        while self._peek()[0] == "identifier" and self._peek()[1] in TYPE_NAME_CONTINUATIONS:
+            self._next()
+        if self._peek()[1] == "(":
+            # Type modifiers, e.g., numeric(10,2)
+            self._parse_list()
+        is_array = False
+        while self._peek()[1] == "[":
+            self._next()
+            self._expect("]")
+            is_array = True
+        return type_name, is_array
+
+    def _parse_list(self, opening="(", closing=")"):
+        self._expect(opening)
+        elements = []
+        if self._peek()[1] == closing:
+            self._next()
+            return elements
+        while True:
+            elements.append(self._parse_or())
+            kind, value = self._next()
+            if value == closing:
+                return elements
+            if value != ",":
+                raise ExpressionParseError(f"Expected , or {closing} but found {value}")
+
+    @staticmethod
+    def _number(text):
+        if "." in text or "e" in text or "E" in text:
+            return float(text)
+        return int(text)
+
+    # ANY's argument is either an array literal, e.g., '{a,b}'::bpchar[], or ARRAY[...]
+    def _array_values(self, node):
+        if node[0] == "array":
+            return node[1]
+        if node[0] == "literal" and isinstance(node[1], str):
+            return [("literal", element) for element in self._array_literal_elements(node[1])]
+        raise ExpressionParseError("Unsupported ANY argument")
+
+    @classmethod
+    def _array_literal_elements(cls, text, type_name=None):
+        text = text.strip()
+        if not (text.startswith("{") and text.endswith("}")):
+            raise ExpressionParseError(f"Invalid array literal {text}")
+
+        elements = []
+        element = []
+        quoted = False
+        escaped = False
+        was_quoted = False
+        for character in text[1:-1]:
+            if escaped:
+                element.append(character)
+                escaped = False
+            elif character == "\\":
+                escaped = True
+            elif character == '"':
+                quoted = not quoted
+                was_quoted = True
+            elif character == "," and not quoted:
+                elements.append(("".join(element), was_quoted))
+                element = []
+                was_quoted = False
+            else:
+                element.append(character)
+        if element or was_quoted:
+            elements.append(("".join(element), was_quoted))
+
+        values = []
+        for value, was_quoted in elements:
+            if not was_quoted:
+                value = value.strip()
+                if value.upper() == "NULL":
+                    continue
+            if type_name in NUMERIC_TYPES:
+                try:
+                    value = cls._number(value)
+                except ValueError:
+                    raise ExpressionParseError(f"Invalid {type_name} array element {value}")
+            values.append(value)
+        return values
+
+    def _intervals(self, node):
+        kind = node[0]
+
+        if kind == "and":
+            intervals = {}
+            for child in node[1]:
+                for column, interval in self._intervals(child).items():
+                    if column in intervals:
+                        intervals[column] = utils.intersect_intervals(intervals[column], interval)
+                    else:
+                        intervals[column] = interval
+            return intervals
+        if kind == "or":
+            # Only columns restricted in every disjunct restrict the whole disjunction
+            children_intervals = [self._intervals(child) for child in node[1]]
+            intervals = children_intervals[0]
+            for child_intervals in children_intervals[1:]:
+                intervals = {
+                    column: utils.union_intervals(interval, child_intervals[column])
+                    for column, interval in intervals.items()
+                    if column in child_intervals
+                }
+            return intervals
+        if kind == "comparison":
+            return self._comparison_intervals(node[1], node[2], node[3])
+        if kind == "any":
+            return self._any_intervals(node[1], node[2], node[3])
+
+        # NOT, IS NULL, boolean columns, function calls, ...
+        return {}
+
+    @staticmethod
+    def _comparison_intervals(operator, left, right):
+        if left[0] == "literal" and right[0] == "column":
+            left, right = right, left
+            operator = FLIPPED_OPERATORS.get(operator, operator)
+        if left[0] != "column" or right[0] != "literal":
+            return {}
+
+        column = left[1]
+        value = right[1]
+        if operator == "=":
+            return {column: (value, value)}
+        elif operator == "<" or operator == "<=":
+            return {column: (None, value)}
+        elif operator == ">" or operator == ">=":
+            return {column: (value, None)}
+        return {}
+
+    @staticmethod
+    def _any_intervals(operator, left, values):
+        if operator != "=" or left[0] != "column" or len(values) == 0:
+            return {}
+        if any(value[0] != "literal" for value in values):
+            return {}
+
+        values = sorted(value[1] for value in values)
+        return {left[1]: (values[0], values[-1])}
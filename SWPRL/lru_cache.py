@@ -0,0 +1,109 @@
+import collections
+import sys
+
+
+# Approximate memory footprint of (nested) cache keys and values, e.g., plans.
+# Objects with __slots__, e.g., PlanNodes, are walked through their set attributes.
+# Shared objects are counted once per entry that references them.
+def approximate_size(obj):
+    size = 0
+    objects = [obj]
+    while objects:
+        current = objects.pop()
+        size += sys.getsizeof(current)
+        if isinstance(current, dict):
+            objects.extend(current.keys())
+            objects.extend(current.values())
+        elif isinstance(current, (list, tuple, set, frozenset)):
+            objects.extend(current)
+        elif hasattr(current, "__slots__"):
+            for slot in current.__slots__:
+                value = getattr(current, slot, None)
+                if value is not None:
+                    objects.append(value)
+    return size
+
+
+# Dictionary-like cache that evicts its least recently used entries once it holds more than max_entries
+# entries or more than max_bytes (approximate) bytes. Without limits, nothing is evicted.
+class LRUCache(object):
+    def __init__(self, max_entries=None, max_bytes=None, size_function=approximate_size):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size_function = size_function
+
+        self.entries = collections.OrderedDict()
+        # {key: size of key and value}
+        self.entry_sizes = {}
+        self.bytes = 0
+        self.evictions = 0
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __getitem__(self, key):
+        value = self.entries[key]
+        self.entries.move_to_end(key)
+        return value
+
+    def get(self, key, default=None):
+        if key in self.entries:
+            return self[key]
+        return default
+
+    def __setitem__(self, key, value):
+        if key in self.entries:
+            self._remove(key)
+        self.entries[key] = value
+        entry_size = self.size_function(key) + self.size_function(value)
+        self.entry_sizes[key] = entry_size
+        self.bytes += entry_size
+        self._evict()
+
+    def __delitem__(self, key):
+        self._remove(key)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        return iter(list(self.entries))
+
+    def keys(self):
+        return list(self.entries.keys())
+
+    def items(self):
+        return list(self.entries.items())
+
+    def clear(self):
+        self.entries.clear()
+        self.entry_sizes.clear()
+        self.bytes = 0
+
+    def _remove(self, key):
+        del self.entries[key]
+        self.bytes -= self.entry_sizes.pop(key)
+
+    def _evict(self):
+        while len(self.entries) > 0 and (
+            (self.max_entries is not None and len(self.entries) > self.max_entries)
+            or (self.max_bytes is not None and self.bytes > self.max_bytes)
+        ):
+            self._remove(next(iter(self.entries)))
+            self.evictions += 1
+
+    # Applies new bounds, e.g., after unpickling a cache
+    def set_limits(self, limits):
+        limits = limits or {}
+        self.max_entries = limits.get("max_entries")
+        self.max_bytes = limits.get("max_bytes")
+        self._evict()
+
+    # Entry count, approximate bytes, and number of evictions for reports
+    def info(self):
+        return {"entries": len(self.entries), "bytes": self.bytes, "evictions": self.evictions}
+
+    @staticmethod
+    def from_limits(limits):
+        limits = limits or {}
+        return LRUCache(max_entries=limits.get("max_entries"), max_bytes=limits.get("max_bytes"))
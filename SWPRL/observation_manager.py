@@ -5,8 +5,9 @@ from gym import spaces
 
 
 class ObservationManager(object):
-    def __init__(self, number_of_actions):
+    def __init__(self, number_of_actions, dtype=np.float64):
         self.number_of_actions = number_of_actions
+        self.dtype = np.dtype(dtype)
 
     def _init_episode(self, state_fix_for_episode):
 
@@ -15,9 +16,29 @@ class ObservationManager(object):
     def init_episode(self, state_fix_for_episode):
         raise NotImplementedError
 
-    def get_observation(self, environment_state):
+    # Observations are written into out if it is given, e.g., a row of a vectorized environment's buffer
+    def get_observation(self, environment_state, out=None):
         raise NotImplementedError
 
+    def _observation_buffer(self, out):
+        if out is None:
+            return np.empty(self.number_of_features, dtype=self.dtype)
+        assert out.shape == (self.number_of_features,), f"Observation buffer has shape {out.shape}"
+        return out
+
+    # Computes the [start, end) offsets of the observation's parts once, parts are (name, length) tuples
+    def _create_offsets(self, parts):
+        self.offsets = {}
+        start = 0
+        for name, length in parts:
+            self.offsets[name] = (start, start + length)
+            start += length
+        assert start == self.number_of_features, "Observation parts do not match number_of_features."
+
+    def _write(self, observation, part, values):
+        start, end = self.offsets[part]
+        observation[start:end] = values
+
     def get_observation_space(self):
         observation_space = spaces.Box(
             low=self._create_low_boundaries(), high=self._create_high_boundaries(), shape=self._create_shape()
@@ -43,7 +64,7 @@ class ObservationManager(object):
 
 class EmbeddingObservationManager(ObservationManager):
     def __init__(self, number_of_actions, config):
-        ObservationManager.__init__(self, number_of_actions)
+        ObservationManager.__init__(self, number_of_actions, config["observation_dtype"])
 
         self.workload_embedder = config["workload_embedder"]
         self.representation_size = self.workload_embedder.representation_size
@@ -58,6 +79,15 @@ class EmbeddingObservationManager(ObservationManager):
             + 1  # The initial workload cost
             + 1  # The current workload cost
         )
+        self._create_offsets(
+            [
+                ("action_status", self.number_of_actions),
+                ("workload_embedding", self.representation_size * self.workload_size),
+                ("frequencies", self.workload_size),
+                ("initial_cost", 1),
+                ("current_cost", 1),
+            ]
+        )
 
     def _init_episode(self, state_fix_for_episode):
         episode_workload = state_fix_for_episode["workload"]
@@ -68,9 +98,9 @@ class EmbeddingObservationManager(ObservationManager):
     def init_episode(self, state_fix_for_episode):
         raise NotImplementedError
 
-    def get_observation(self, environment_state):
+    def get_observation(self, environment_state, out=None):
         if self.UPDATE_EMBEDDING_PER_OBSERVATION:
-            workload_embedding = np.array(self.workload_embedder.get_embeddings(environment_state["plans_per_query"]))
+            workload_embedding = self.workload_embedder.get_embeddings(environment_state["plans_per_query"])
         else:
             # In this case the workload embedding is not updated with every step but also not set during init
             if self.workload_embedding is None:
@@ -80,11 +110,12 @@ class EmbeddingObservationManager(ObservationManager):
 
             workload_embedding = self.workload_embedding
 
-        observation = np.array(environment_state["action_status"])
-        observation = np.append(observation, workload_embedding)
-        observation = np.append(observation, self.frequencies)
-        observation = np.append(observation, self.initial_cost)
-        observation = np.append(observation, environment_state["current_cost"])
+        observation = self._observation_buffer(out)
+        self._write(observation, "action_status", environment_state["action_status"])
+        self._write(observation, "workload_embedding", np.ravel(workload_embedding))
+        self._write(observation, "frequencies", self.frequencies)
+        self._write(observation, "initial_cost", self.initial_cost)
+        self._write(observation, "current_cost", environment_state["current_cost"])
 
         return observation
 
@@ -112,19 +143,30 @@ class PartitionPlanEmbeddingObservationManagerWithCost(EmbeddingObservationManag
             + 1  # The initial workload cost
             + 1  # The current workload cost
         )
+        self._create_offsets(
+            [
+                ("action_status", self.number_of_actions),
+                ("workload_embedding", self.representation_size * self.workload_size),
+                ("costs_per_query", self.workload_size),
+                ("frequencies", self.workload_size),
+                ("initial_cost", 1),
+                ("current_cost", 1),
+            ]
+        )
 
     def init_episode(self, state_fix_for_episode):
         super()._init_episode(state_fix_for_episode)
 
     # This overwrite EmbeddingObservationManager.get_observation() because further features are added
-    def get_observation(self, environment_state):
-        workload_embedding = np.array(self.workload_embedder.get_embeddings(environment_state["plans_per_query"]))
-        observation = np.array(environment_state["action_status"])
-        observation = np.append(observation, workload_embedding)
-        observation = np.append(observation, environment_state["costs_per_query"])
-        observation = np.append(observation, self.frequencies)
-        observation = np.append(observation, self.initial_cost)
-        observation = np.append(observation, environment_state["current_cost"])
+    def get_observation(self, environment_state, out=None):
+        workload_embedding = self.workload_embedder.get_embeddings(environment_state["plans_per_query"])
+        observation = self._observation_buffer(out)
+        self._write(observation, "action_status", environment_state["action_status"])
+        self._write(observation, "workload_embedding", np.ravel(workload_embedding))
+        self._write(observation, "costs_per_query", environment_state["costs_per_query"])
+        self._write(observation, "frequencies", self.frequencies)
+        self._write(observation, "initial_cost", self.initial_cost)
+        self._write(observation, "current_cost", environment_state["current_cost"])
 
         return observation
 
@@ -143,17 +185,26 @@ class PartitionPlanEmbeddingObservationManager(EmbeddingObservationManager):
             + 1  # The initial workload cost
             + 1  # The current workload cost
         )
+        self._create_offsets(
+            [
+                ("action_status", self.number_of_actions),
+                ("workload_embedding", self.representation_size * self.workload_size),
+                ("initial_cost", 1),
+                ("current_cost", 1),
+            ]
+        )
 
     def init_episode(self, state_fix_for_episode):
         super()._init_episode(state_fix_for_episode)
 
     # This overwrite EmbeddingObservationManager.get_observation() because further features are added
-    def get_observation(self, environment_state):
-        workload_embedding = np.array(self.workload_embedder.get_embeddings(environment_state["plans_per_query"]))
-        observation = np.array(environment_state["action_status"])
-        observation = np.append(observation, workload_embedding)
-        observation = np.append(observation, self.initial_cost)
-        observation = np.append(observation, environment_state["current_cost"])
+    def get_observation(self, environment_state, out=None):
+        workload_embedding = self.workload_embedder.get_embeddings(environment_state["plans_per_query"])
+        observation = self._observation_buffer(out)
+        self._write(observation, "action_status", environment_state["action_status"])
+        self._write(observation, "workload_embedding", np.ravel(workload_embedding))
+        self._write(observation, "initial_cost", self.initial_cost)
+        self._write(observation, "current_cost", environment_state["current_cost"])
 
         return observation
 
@@ -4,7 +4,7 @@ from index_selection_evaluation.selection.workload import Column
 
 @total_ordering
 class Partition:
-    def __init__(self, column, value=None, no_more_partitions=False):
+    def __init__(self, column, value=None, no_more_partitions=False, partition_id=None):
         if not isinstance(column, Column):
             raise ValueError("Partition needs at least and at most 1 column (be of instance Column)")
         self.column = column
@@ -12,10 +12,14 @@ class Partition:
         self.invalid = False
         self.no_more_partitions = no_more_partitions
         self.hypopg_name = None
+        # Small and stable integer id, assigned by utils.all_partitions_from_columns.
+        # It is the bit of this partition in partition bitmasks.
+        self.id = partition_id
         if column.is_date():
             self.partition_rate = value
         else:
             self.upper_bound = value
+        self._hash = hash((column, value))
 
     def upper_bound_value(self, percentiles):
         if self.upper_bound is None:
@@ -57,7 +61,7 @@ class Partition:
         return self.column == other.column and self.upper_bound == other.upper_bound
 
     def __hash__(self):
-        return hash(self.column)
+        return self._hash
 
     def _column_names(self):
         return self.column.name
@@ -0,0 +1,86 @@
+import hashlib
+import json
+import logging
+import pickle
+import sqlite3
+
+
+# Changes whenever the table statistics change (e.g., after ANALYZE or data modifications).
+STATISTICS_FINGERPRINT_STATEMENT = (
+    "SELECT md5(string_agg(c.relname || ':' || c.reltuples::text || ':' || c.relpages::text, ',' ORDER BY c.relname)) "
+    "FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace "
+    "WHERE c.relkind = 'r' AND n.nspname NOT IN ('pg_catalog', 'information_schema');"
+)
+
+
+MMAP_SIZE = 1024 * 1024 * 1024
+
+
+def database_fingerprint(db_connector):
+    statistics_hash = db_connector.exec_fetch(STATISTICS_FINGERPRINT_STATEMENT)[0]
+    return f"{db_connector.db_name}_{statistics_hash}"
+
+
+def query_hash(query_text):
+    return hashlib.sha1(query_text.encode("utf-8")).hexdigest()
+
+
+# Persists EXPLAIN plans and column percentiles, i.e., the results of database requests, in a SQLite database
+# so that they can be reused by later runs. Entries are only valid for the database (and its statistics)
+# described by the fingerprint. Estimated costs depend on the estimator's code and are not persisted.
+# The file is also shared by concurrently running processes (e.g., SubprocVecEnv workers):
+# reads go through a memory-mapped file and SQLite's WAL mode allows a single writer at a time
+# without blocking readers.
+class PersistentCostCache(object):
+    def __init__(self, path, fingerprint):
+        logging.debug(f"Init persistent cost cache at {path}")
+
+        self.path = path
+        self.fingerprint = fingerprint
+
+        # Autocommit mode, every store is written immediately
+        self.connection = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL;")
+        self.connection.execute(f"PRAGMA mmap_size={MMAP_SIZE};")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS plans "
+            "(fingerprint TEXT, query_hash TEXT, query_text TEXT, plan TEXT, PRIMARY KEY (fingerprint, query_hash));"
+        )
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS percentiles "
+            "(fingerprint TEXT, column_key TEXT, percentiles BLOB, PRIMARY KEY (fingerprint, column_key));"
+        )
+
+    def load_plans(self):
+        rows = self.connection.execute(
+            "SELECT query_text, plan FROM plans WHERE fingerprint = ?;", (self.fingerprint,)
+        ).fetchall()
+        return {query_text: json.loads(plan) for query_text, plan in rows}
+
+    def lookup_plan(self, query_text):
+        row = self.connection.execute(
+            "SELECT plan FROM plans WHERE fingerprint = ? AND query_hash = ?;", (self.fingerprint, query_hash(query_text))
+        ).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def lookup_percentiles(self, column_key):
+        row = self.connection.execute(
+            "SELECT percentiles FROM percentiles WHERE fingerprint = ? AND column_key = ?;",
+            (self.fingerprint, column_key),
+        ).fetchone()
+        return None if row is None else pickle.loads(row[0])
+
+    def store_plan(self, query_text, plan):
+        self.connection.execute(
+            "INSERT OR REPLACE INTO plans VALUES (?, ?, ?, ?);",
+            (self.fingerprint, query_hash(query_text), query_text, json.dumps(plan)),
+        )
+
+    def store_percentiles(self, column_key, percentiles):
+        self.connection.execute(
+            "INSERT OR REPLACE INTO percentiles VALUES (?, ?, ?);",
+            (self.fingerprint, column_key, pickle.dumps(percentiles, protocol=pickle.HIGHEST_PROTOCOL)),
+        )
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,138 @@
+import hashlib
+
+# EXPLAIN (FORMAT JSON) attributes that are kept, i.e., the ones read by CostEvaluation.estimate_cost
+# and BagOfOperators, and the slots that store them.
+PLAN_ATTRIBUTES = {
+    "Node Type": "node_type",
+    "Relation Name": "relation_name",
+    "Total Cost": "total_cost",
+    "Filter": "filter",
+    "Index Cond": "index_cond",
+    "Join Filter": "join_filter",
+    "Hash Cond": "hash_cond",
+    "Merge Cond": "merge_cond",
+    "Sort Key": "sort_key",
+}
+
+
+# Slim replacement for the plan dictionaries returned by EXPLAIN.
+# Nodes support read access like the dictionaries (plan["Total Cost"], "Filter" in plan, plan["Plans"])
+# and precompute a structural fingerprint from their attributes and their children's fingerprints.
+# Fingerprints are short, stable across processes, and serve as keys of plan-keyed caches, such that
+# equal plans are found without comparing or stringifying them.
+class PlanNode(object):
+    __slots__ = (
+        "node_type",
+        "relation_name",
+        "total_cost",
+        "filter",
+        "index_cond",
+        "join_filter",
+        "hash_cond",
+        "merge_cond",
+        "sort_key",
+        "plans",
+        "fingerprint",
+        "_hash",
+    )
+
+    def __init__(
+        self,
+        node_type,
+        relation_name=None,
+        total_cost=None,
+        filter=None,
+        index_cond=None,
+        join_filter=None,
+        hash_cond=None,
+        merge_cond=None,
+        sort_key=None,
+        plans=(),
+    ):
+        self.node_type = node_type
+        self.relation_name = relation_name
+        self.total_cost = total_cost
+        self.filter = filter
+        self.index_cond = index_cond
+        self.join_filter = join_filter
+        self.hash_cond = hash_cond
+        self.merge_cond = merge_cond
+        self.sort_key = None if sort_key is None else tuple(sort_key)
+        self.plans = tuple(plans)
+
+        # The node's attributes without its children, which contribute their fingerprints
+        digest = hashlib.blake2b(repr(self._fields()[:-1]).encode("utf-8"), digest_size=16)
+        for sub_plan in self.plans:
+            digest.update(sub_plan.fingerprint)
+        self.fingerprint = digest.digest()
+        self._hash = int.from_bytes(self.fingerprint[:8], "little", signed=True)
+
+    @staticmethod
+    def from_dict(plan):
+        if isinstance(plan, PlanNode):
+            return plan
+        attributes = {slot: plan[key] for key, slot in PLAN_ATTRIBUTES.items() if key in plan}
+        children = [PlanNode.from_dict(sub_plan) for sub_plan in plan.get("Plans", [])]
+        return PlanNode(plans=children, **attributes)
+
+    def to_dict(self):
+        plan = {key: self[key] for key in self.keys()}
+        if "Sort Key" in plan:
+            plan["Sort Key"] = list(plan["Sort Key"])
+        if self.plans:
+            plan["Plans"] = [sub_plan.to_dict() for sub_plan in self.plans]
+        return plan
+
+    def _fields(self):
+        return (
+            self.node_type,
+            self.relation_name,
+            self.total_cost,
+            self.filter,
+            self.index_cond,
+            self.join_filter,
+            self.hash_cond,
+            self.merge_cond,
+            self.sort_key,
+            self.plans,
+        )
+
+    def keys(self):
+        keys = [key for key, slot in PLAN_ATTRIBUTES.items() if getattr(self, slot) is not None]
+        if self.plans:
+            keys.append("Plans")
+        return keys
+
+    def __getitem__(self, key):
+        if key == "Plans":
+            if not self.plans:
+                raise KeyError(key)
+            return self.plans
+        value = getattr(self, PLAN_ATTRIBUTES[key])
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        if key == "Plans":
+            return len(self.plans) > 0
+        return key in PLAN_ATTRIBUTES and getattr(self, PLAN_ATTRIBUTES[key]) is not None
+
+    def get(self, key, default=None):
+        if key in self:
+            return self[key]
+        return default
+
+    def __hash__(self):
+        return self._hash
+
+    def __eq__(self, other):
+        if not isinstance(other, PlanNode):
+            return False
+        return self.fingerprint == other.fingerprint
+
+    def __repr__(self):
+        return f"PlanNode({self.to_dict()})"
+
+    def __reduce__(self):
+        return (PlanNode, self._fields())
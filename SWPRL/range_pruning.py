@@ -0,0 +1,101 @@
+import numpy as np
+
+# Range partitions split a column at its deciles, see utils.all_partitions_from_columns
+DECILE_UPPER_BOUNDS = np.arange(1, 10) / 10
+DECILE_COUNT = len(DECILE_UPPER_BOUNDS)
+
+
+# Converts the rows returned by get_column_percentiles into a typed array, which is created once per column
+def percentile_values(percentile_rows, numeric):
+    values = [row[0] for row in percentile_rows]
+    if numeric:
+        values = np.array(values, dtype=np.float64)
+    else:
+        values = np.array([str(value) for value in values], dtype=str)
+    values.flags.writeable = False
+    return values
+
+
+# Text percentiles follow the database's collation, which may differ from Python's string order
+def is_sorted(values):
+    return len(values) < 2 or bool(np.all(values[:-1] <= values[1:]))
+
+
+# Index into the percentiles of every decile, as in Partition.upper_bound_value
+def decile_indexes(percentiles_count):
+    return (DECILE_UPPER_BOUNDS * 10 - 1).astype(int) % percentiles_count
+
+
+# Positions of the deciles' percentile values with respect to a bound.
+# For sorted percentiles, the values greater than or equal to the bound start at searchsorted's position.
+def _at_least(values, values_sorted, indexes, bound):
+    if values_sorted:
+        return indexes >= np.searchsorted(values, bound, side="left")
+    return values[indexes] >= bound
+
+
+# Flags the deciles whose partition bound is hit by the interval's scan:
+# - upper bound only (< or <=): percentile value >= maximum
+# - lower bound only (> or >=): percentile value < minimum
+# - both bounds: percentile value >= minimum and >= maximum
+def decile_hits(values, values_sorted, interval):
+    indexes = decile_indexes(len(values))
+    minimum, maximum = interval
+    if minimum is None:
+        return _at_least(values, values_sorted, indexes, maximum)
+    if maximum is None:
+        return ~_at_least(values, values_sorted, indexes, minimum)
+    return _at_least(values, values_sorted, indexes, minimum) & _at_least(values, values_sorted, indexes, maximum)
+
+
+# Estimates the cost of scanning total_cost's relation for an interval on one column for several partitionings
+# at once. selections is a boolean (partitionings x 9) matrix of the chosen deciles and more_partitions flags
+# the partitionings that additionally contain the column's no_more_partitions partition.
+def range_pruning_costs(total_cost, values, values_sorted, interval, selections, more_partitions=False):
+    selections = np.atleast_2d(np.asarray(selections, dtype=bool))
+    rows = np.arange(len(selections))
+    positions = np.arange(DECILE_COUNT)
+
+    selected_hits = selections & decile_hits(values, values_sorted, interval)
+    any_hit = selected_hits.any(axis=1)
+    first_hit = np.argmax(selected_hits, axis=1)
+
+    selected_count = selections.sum(axis=1)
+    selected_before_hit = np.cumsum(selections, axis=1)[rows, first_hit] - 1
+    # Bound of the last chosen decile before the first hit or, without hits, of the last chosen one
+    last_selected = np.maximum.accumulate(np.where(selections, positions, -1), axis=1)
+    previous_selected = np.where(
+        any_hit, np.where(first_hit > 0, last_selected[rows, first_hit - 1], -1), last_selected[:, -1]
+    )
+    previous_bound = np.where(previous_selected >= 0, DECILE_UPPER_BOUNDS[previous_selected], 0)
+    hit_bound = np.where(any_hit, DECILE_UPPER_BOUNDS[first_hit], 1)
+
+    minimum, maximum = interval
+    if minimum is None:
+        maximum_bounds = hit_bound
+        minimum_bounds = np.zeros(len(selections))
+        total_partitions = np.where(any_hit, selected_before_hit + 1, selected_count + 1)
+    elif maximum is None:
+        maximum_bounds = np.ones(len(selections))
+        minimum_bounds = previous_bound
+        partitions_count = selected_count + np.asarray(more_partitions, dtype=int)
+        total_partitions = np.where(any_hit, partitions_count - selected_before_hit, 1)
+    else:
+        maximum_bounds = hit_bound
+        minimum_bounds = previous_bound
+        total_partitions = np.ones(len(selections), dtype=int)
+
+    costs = total_cost * (maximum_bounds - minimum_bounds) * total_partitions
+    return np.where(total_partitions == DECILE_COUNT, total_cost * DECILE_COUNT, costs)
+
+
+# Deciles chosen by the given (non-date) partitions of one column
+def decile_selection(partitions):
+    selection = np.zeros(DECILE_COUNT, dtype=bool)
+    more_partitions = False
+    for partition in partitions:
+        if partition.no_more_partitions:
+            more_partitions = True
+        else:
+            selection[int(round(partition.upper_bound * 10)) - 1] = True
+    return selection, more_partitions
@@ -0,0 +1,204 @@
+import atexit
+import glob
+import gzip
+import itertools
+import logging
+import os
+import pickle
+import threading
+
+from index_selection_evaluation.selection.dbms.postgres_dbms import PostgresDatabaseConnector
+
+# Connector methods whose results depend only on their arguments and the database's data and statistics
+RECORDED_METHODS = frozenset(
+    [
+        "get_plan",
+        "get_cost",
+        "get_column_percentiles",
+        "get_column_statistics",
+        "_type",
+        "exec_fetch",
+        "database_names",
+        "indexes_size",
+        "update_query_text",
+    ]
+)
+# Methods that only change the database's state, they are ignored when replaying
+IGNORED_METHODS = frozenset(
+    [
+        "exec_only",
+        "commit",
+        "rollback",
+        "close",
+        "create_statistics",
+        "create_database",
+        "import_data",
+        "enable_simulation",
+        "set_random_seed",
+        "simulate_partition",
+        "drop_simulated_partition",
+        "drop_partitions",
+        "create_index",
+        "drop_index",
+        "drop_indexes",
+    ]
+)
+
+# New responses are appended to the recording after this many of them, on save, close, and exit of the process
+SAVE_FREQUENCY = 1000
+
+shard_numbers = itertools.count()
+
+
+class ReplayMissError(Exception):
+    pass
+
+
+# Queries are identified by their text and columns by their table and name, other arguments by their value
+def _argument_key(argument):
+    if hasattr(argument, "text"):
+        return argument.text
+    if hasattr(argument, "table") and hasattr(argument, "name"):
+        return (argument.table.name, argument.name)
+    if isinstance(argument, (list, tuple)):
+        return tuple(_argument_key(element) for element in argument)
+    try:
+        hash(argument)
+    except TypeError:
+        return repr(argument)
+    return argument
+
+
+def _response_key(database_name, method_name, args, kwargs):
+    return (
+        database_name,
+        method_name,
+        tuple(_argument_key(argument) for argument in args),
+        tuple(sorted((name, _argument_key(argument)) for name, argument in kwargs.items())),
+    )
+
+
+# Wraps a PostgresDatabaseConnector and records the results of its RECORDED_METHODS into a shard file
+# {path}/{process id}_{shard number}.pickle.gzip. Every connector writes its own shard, hence, the
+# connectors of several processes and threads can record into the same directory.
+# Shards are sequences of pickled dictionaries, every save appends the responses since the last one.
+class RecordingConnector(object):
+    def __init__(self, connector, path):
+        self.connector = connector
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.shard_path = f"{path}/{os.getpid()}_{next(shard_numbers)}.pickle.gzip"
+
+        # {(database name, method name, argument keys, keyword argument keys): result}
+        self.responses = {}
+        self.unsaved_responses = {}
+        self.lock = threading.Lock()
+        atexit.register(self.save)
+
+    def __getattr__(self, name):
+        attribute = getattr(self.connector, name)
+        if name not in RECORDED_METHODS:
+            return attribute
+
+        def record(*args, **kwargs):
+            result = attribute(*args, **kwargs)
+            key = _response_key(self.connector.db_name, name, args, kwargs)
+            with self.lock:
+                # The first response is kept, like the plan cache of CostEvaluation does
+                if key not in self.responses:
+                    self.responses[key] = result
+                    self.unsaved_responses[key] = result
+                save = len(self.unsaved_responses) >= SAVE_FREQUENCY
+            if save:
+                self.save()
+            return result
+
+        return record
+
+    def save(self):
+        with self.lock:
+            if len(self.unsaved_responses) == 0:
+                return
+            responses = self.unsaved_responses
+            self.unsaved_responses = {}
+
+            with gzip.open(self.shard_path, "ab") as handle:
+                pickle.dump(responses, handle, protocol=pickle.HIGHEST_PROTOCOL)
+        logging.debug(f"Saved {len(responses)} database responses to {self.shard_path}")
+
+    def close(self):
+        self.save()
+        self.connector.close()
+
+
+# Recordings are loaded once per process and path
+loaded_recordings = {}
+loaded_recordings_lock = threading.Lock()
+
+
+def load_recording(path):
+    with loaded_recordings_lock:
+        if path not in loaded_recordings:
+            responses = {}
+            shard_paths = sorted(glob.glob(f"{path}/*.pickle.gzip"))
+            assert len(shard_paths) > 0, f"No recorded database responses found in {path}."
+            for shard_path in shard_paths:
+                with gzip.open(shard_path, "rb") as handle:
+                    while True:
+                        try:
+                            shard_responses = pickle.load(handle)
+                        except EOFError:
+                            break
+                        for key, result in shard_responses.items():
+                            responses.setdefault(key, result)
+            logging.info(f"Loaded {len(responses)} database responses from {len(shard_paths)} shards in {path}")
+            loaded_recordings[path] = responses
+        return loaded_recordings[path]
+
+
+# Serves the responses recorded by RecordingConnectors without a database.
+# State changing methods are ignored, requests that were not recorded raise a ReplayMissError.
+class ReplayConnector(object):
+    def __init__(self, database_name, path, autocommit=True):
+        self.db_name = database_name
+        self.path = path
+        self.responses = load_recording(path)
+
+        self.cost_estimation_duration = 0
+        self.index_simulation_duration = 0
+        self.simulated_indexes = 0
+
+    def __getattr__(self, name):
+        if name in IGNORED_METHODS:
+            return lambda *args, **kwargs: None
+        if name not in RECORDED_METHODS:
+            raise AttributeError(f"ReplayConnector does not support {name}")
+
+        def replay(*args, **kwargs):
+            key = _response_key(self.db_name, name, args, kwargs)
+            if key not in self.responses:
+                raise ReplayMissError(f"No recorded response for {name}{key[2]} on database {self.db_name}")
+            return self.responses[key]
+
+        return replay
+
+
+# Creates the database connectors of an experiment, the signature matches PostgresDatabaseConnector's.
+# mode is None for live connections, "record" to additionally record the responses into path, or
+# "replay" to serve recorded responses without a database. Factories are picklable, e.g., for SubprocVecEnv.
+class ConnectorFactory(object):
+    def __init__(self, mode=None, path=None):
+        assert mode in [None, "record", "replay"], f"Unknown database connector mode: {mode}"
+        assert mode is None or path is not None, "Recording and replaying database responses requires a path."
+
+        self.mode = mode
+        self.path = path
+
+    def __call__(self, database_name, autocommit=True):
+        if self.mode == "replay":
+            return ReplayConnector(database_name, self.path, autocommit=autocommit)
+
+        connector = PostgresDatabaseConnector(database_name, autocommit=autocommit)
+        if self.mode == "record":
+            return RecordingConnector(connector, self.path)
+        return connector
@@ -5,9 +5,10 @@ from index_selection_evaluation.selection.dbms.postgres_dbms import PostgresData
 from index_selection_evaluation.selection.table_generator import TableGenerator
 
 
+# connector_factory(database_name, autocommit) creates the database connections, see replay_connector.ConnectorFactory
 class Schema(object):
-    def __init__(self, benchmark_name, scale_factor, filters={}):
-        generating_connector = PostgresDatabaseConnector(None, autocommit=True)
+    def __init__(self, benchmark_name, scale_factor, filters={}, connector_factory=PostgresDatabaseConnector):
+        generating_connector = connector_factory(None, autocommit=True)
         table_generator = TableGenerator(
             benchmark_name=benchmark_name.lower(), scale_factor=scale_factor, database_connector=generating_connector
         )
@@ -15,7 +16,7 @@ class Schema(object):
         self.database_name = table_generator.database_name()
         self.tables = table_generator.tables
 
-        connector = PostgresDatabaseConnector(self.database_name, autocommit=True)
+        connector = connector_factory(self.database_name, autocommit=True)
 
         self.columns = []
         for table in self.tables:
@@ -25,14 +26,14 @@ class Schema(object):
 
         for filter_name in filters.keys():
             filter_class = getattr(importlib.import_module("SWPRL.schema"), filter_name)
-            filter_instance = filter_class(filters[filter_name], self.database_name)
+            filter_instance = filter_class(filters[filter_name], self.database_name, connector_factory)
             self.columns = filter_instance.apply_filter(self.columns)
 
 
 class TableNumRowsFilter(object):
-    def __init__(self, threshold, database_name):
+    def __init__(self, threshold, database_name, connector_factory=PostgresDatabaseConnector):
         self.threshold = threshold
-        self.connector = PostgresDatabaseConnector(database_name, autocommit=True)
+        self.connector = connector_factory(database_name, autocommit=True)
         self.connector.create_statistics()
 
     def apply_filter(self, columns):
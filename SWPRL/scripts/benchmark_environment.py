@@ -0,0 +1,423 @@
+import argparse
+import contextlib
+import hashlib
+import json
+import logging
+import platform
+import random
+import re
+import sys
+import time
+
+import numpy as np
+
+from gym_db.common import EnvironmentType
+from gym_db.envs.db_env_v2 import DBEnvV2
+from index_selection_evaluation.selection.workload import Column, Query, Table, Workload
+from SWPRL import utils
+from SWPRL.action_manager import PartitionActionManager
+from SWPRL.cost_evaluation import CostEvaluation
+from SWPRL.observation_manager import PartitionPlanEmbeddingObservationManagerWithCost
+from SWPRL.persistent_cost_cache import STATISTICS_FINGERPRINT_STATEMENT
+from SWPRL.plan import PlanNode
+from SWPRL.reward_calculator import RelativeDifferenceToPreviousReward
+from SWPRL.workload_embedder import PlanEmbedderLSIBOW
+
+# Micro-benchmarks of the environment's hot path on a synthetic schema, workloads, and plans.
+# No database is needed: a synthetic connector serves the plans and percentiles.
+# Measures DBEnvV2.reset/step, CostEvaluation.calculate_cost_and_plans, PlanEmbedder.get_embeddings,
+# and the action mask updates, and writes the results as JSON for regression tracking.
+#
+# Usage: python -m SWPRL.scripts.benchmark_environment [--tables 5] [--columns 8] [--query-classes 30]
+#            [--workload-size 10] [--plan-depth 6] [--episodes 50] [--persistent-cost-cache cache.sqlite]
+#            [--output results.json]
+# Runs with the same arguments use the same schema, workloads, plans, embedder, and actions, i.e., settings such as
+# --transition-cache or --persistent-cost-cache can be compared across runs.
+
+DATABASE_NAME = "synthetic_benchmark"
+COLUMN_VALUE_RANGE = 1000
+COMPARISON_OPERATORS = ["<", "<=", ">", ">=", "="]
+JOIN_NODE_TYPES = ["Hash Join", "Nested Loop", "Merge Join"]
+UNARY_NODE_TYPES = ["Aggregate", "Sort", "Gather", "Materialize", "Hash"]
+BATCH_TEXT_REGEX = re.compile(r"'((?:[^']|'')*)'")
+
+
+# Serves the synthetic plans and percentiles, statements that change the database are ignored
+class SyntheticConnector(object):
+    def __init__(self, plans_by_text, percentiles_by_column):
+        self.db_name = DATABASE_NAME
+        self.plans_by_text = plans_by_text
+        self.percentiles_by_column = percentiles_by_column
+        # Identifies the synthetic data in persistent cost caches, like the statistics of a real database
+        self.statistics_hash = hashlib.md5(json.dumps(plans_by_text, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def get_plan(self, query):
+        return self.plans_by_text[query.text]
+
+    def get_column_percentiles(self, column):
+        return self.percentiles_by_column[(column.table.name, column.name)]
+
+    def _type(self, column):
+        return column.type
+
+    # Answers the batched EXPLAIN of CostEvaluation._get_plans_batched
+    def exec_fetch(self, statement, one=True):
+        if statement == STATISTICS_FINGERPRINT_STATEMENT:
+            return (self.statistics_hash,)
+        array = statement[statement.index("ARRAY[") :]
+        texts = [text.replace("''", "'") for text in BATCH_TEXT_REGEX.findall(array)]
+        rows = [([{"Plan": self.plans_by_text[text]}],) for text in texts]
+        return rows[0] if one else rows
+
+    def exec_only(self, statement):
+        pass
+
+    def simulate_partition(self, partition):
+        pass
+
+    def drop_simulated_partition(self, table_name, partition):
+        pass
+
+    def drop_partitions(self):
+        pass
+
+    def close(self):
+        pass
+
+
+# Environments create their connections through a factory, see replay_connector.ConnectorFactory
+class SyntheticConnectorFactory(object):
+    def __init__(self, connector):
+        self.connector = connector
+
+    def __call__(self, database_name, autocommit=True):
+        return self.connector
+
+
+class SyntheticBenchmark(object):
+    def __init__(self, arguments):
+        self.arguments = arguments
+        self.rnd = random.Random(arguments.seed)
+
+        self.columns = self._create_columns()
+        self.columns_flat = [column for table_columns in self.columns for column in table_columns]
+        self.all_partitions = utils.all_partitions_from_columns(self.columns)
+        self.all_partitions_flat = [
+            partition for table in self.all_partitions for column in table for partition in column
+        ]
+
+        self.plans_by_text = {}
+        self.query_texts = []
+        self.queries = [self._create_query(query_class) for query_class in range(arguments.query_classes)]
+        self.workloads = [
+            Workload(self.rnd.sample(self.queries, arguments.workload_size)) for _ in range(arguments.workloads)
+        ]
+
+        percentiles_by_column = {}
+        for column in self.columns_flat:
+            values = sorted(self.rnd.randint(0, COLUMN_VALUE_RANGE) for _ in range(10))
+            percentiles_by_column[(column.table.name, column.name)] = [(value,) for value in values]
+        self.connector = SyntheticConnector(self.plans_by_text, percentiles_by_column)
+
+        self.workload_embedder = PlanEmbedderLSIBOW(
+            self.query_texts,
+            arguments.representation_size,
+            self.connector,
+            self.columns_flat,
+            random_seed=arguments.seed,
+        )
+
+    def _create_columns(self):
+        columns = []
+        for table_idx in range(self.arguments.tables):
+            table = Table(f"table_{table_idx}")
+            table_columns = []
+            for column_idx in range(self.arguments.columns):
+                column = Column(f"column_{table_idx}_{column_idx}")
+                column.type = "integer"
+                table.add_column(column)
+                table_columns.append(column)
+            columns.append(table_columns)
+        return columns
+
+    # Queries join up to three tables and filter one or two of their columns
+    def _create_query(self, query_class):
+        tables = self.rnd.sample(self.columns, self.rnd.randint(1, min(3, len(self.columns))))
+        filtered_columns = []
+        for table_columns in tables:
+            filtered_columns.append(self.rnd.sample(table_columns, min(self.rnd.randint(1, 2), len(table_columns))))
+
+        conditions = [
+            (column, self.rnd.choice(COMPARISON_OPERATORS), self.rnd.randint(0, COLUMN_VALUE_RANGE))
+            for table_columns in filtered_columns
+            for column in table_columns
+        ]
+        table_names = ", ".join(table_columns[0].table.name for table_columns in tables)
+        condition_texts = " AND ".join(f"{column.name} {operator} {value}" for column, operator, value in conditions)
+        text = f"SELECT count(*) FROM {table_names} WHERE {condition_texts} /* class {query_class} */"
+
+        query = Query(query_class, text, columns=[column for column, _, _ in conditions])
+        query.frequency = self.rnd.randint(1, 10000)
+        self.plans_by_text[text] = self._create_plan(conditions)
+        self.query_texts.append([text])
+        return query
+
+    # Scans with filters are joined pairwise and topped with unary nodes up to the plan depth
+    def _create_plan(self, conditions):
+        conditions_by_table = {}
+        for column, operator, value in conditions:
+            conditions_by_table.setdefault(column.table.name, []).append(f"({column.name} {operator} {value})")
+
+        nodes = []
+        for table_name, table_conditions in conditions_by_table.items():
+            condition = table_conditions[0] if len(table_conditions) == 1 else f"({' AND '.join(table_conditions)})"
+            if self.rnd.random() < 0.5:
+                node = {"Node Type": "Seq Scan", "Relation Name": table_name, "Filter": condition}
+            else:
+                node = {"Node Type": "Index Scan", "Relation Name": table_name, "Index Cond": condition}
+            node["Total Cost"] = round(self.rnd.uniform(100, 100000), 2)
+            nodes.append(node)
+
+        while len(nodes) > 1:
+            children = [nodes.pop(), nodes.pop()]
+            nodes.append(self._parent_node(self.rnd.choice(JOIN_NODE_TYPES), children))
+
+        plan = nodes[0]
+        for _ in range(self.arguments.plan_depth - self._depth(plan)):
+            plan = self._parent_node(self.rnd.choice(UNARY_NODE_TYPES), [plan])
+        return plan
+
+    def _parent_node(self, node_type, children):
+        total_cost = sum(child["Total Cost"] for child in children) + round(self.rnd.uniform(1, 1000), 2)
+        return {"Node Type": node_type, "Total Cost": total_cost, "Plans": children}
+
+    @staticmethod
+    def _depth(plan):
+        return 1 + max([SyntheticBenchmark._depth(child) for child in plan.get("Plans", [])], default=0)
+
+    def make_action_manager(self):
+        return PartitionActionManager(
+            partitionable_columns=self.columns, sb_version=self.arguments.sb_version, all_partitions=self.all_partitions
+        )
+
+    def make_environment(self):
+        action_manager = self.make_action_manager()
+        observation_manager = PartitionPlanEmbeddingObservationManagerWithCost(
+            action_manager.number_of_actions,
+            {
+                "number_of_query_classes": self.arguments.query_classes,
+                "workload_embedder": self.workload_embedder,
+                "workload_size": self.arguments.workload_size,
+                "observation_dtype": self.arguments.observation_dtype,
+            },
+        )
+        config = {
+            "database_name": DATABASE_NAME,
+            "globally_partitionable_columns_flat": self.columns_flat,
+            "all_partitions": self.all_partitions,
+            "all_partitions_flat": action_manager.all_partitions_flat,
+            "workloads": self.workloads,
+            "random_seed": self.arguments.seed,
+            "max_steps_per_episode": self.arguments.max_steps_per_episode,
+            "action_manager": action_manager,
+            "observation_manager": observation_manager,
+            "reward_calculator": RelativeDifferenceToPreviousReward(),
+            "env_id": 0,
+            "similar_workloads": False,
+            "persistent_cost_cache": self.arguments.persistent_cost_cache,
+            "plan_fetch_concurrency": 1,
+            "cache_limits": {},
+            "transition_cache": self.arguments.transition_cache,
+            "connector_factory": SyntheticConnectorFactory(self.connector),
+            "prefetch_next_workload": self.arguments.prefetch_next_workload,
+        }
+        return DBEnvV2(EnvironmentType.TRAINING, config)
+
+    def random_partitions(self):
+        number_of_partitions = self.rnd.randint(1, self.arguments.max_steps_per_episode)
+        return utils.partitions_to_bitmask(self.rnd.sample(self.all_partitions_flat, number_of_partitions))
+
+
+def _allowed_actions(action_manager, valid_actions):
+    return np.flatnonzero(np.asarray(valid_actions) == action_manager.ALLOWED_ACTION)
+
+
+def summarize(durations):
+    durations = np.array(durations)
+    return {
+        "count": len(durations),
+        "mean_ms": float(durations.mean() * 1000),
+        "p50_ms": float(np.percentile(durations, 50) * 1000),
+        "p95_ms": float(np.percentile(durations, 95) * 1000),
+        "per_second": float(len(durations) / durations.sum()) if durations.sum() > 0 else None,
+    }
+
+
+# Random episodes, the first ones fill the caches
+def benchmark_environment(benchmark, episodes):
+    env = benchmark.make_environment()
+    rnd = random.Random(benchmark.arguments.seed)
+
+    reset_durations = []
+    step_durations = []
+    for _ in range(episodes):
+        start_time = time.perf_counter()
+        env.reset()
+        reset_durations.append(time.perf_counter() - start_time)
+
+        done = False
+        while not done:
+            action = int(rnd.choice(_allowed_actions(env.action_manager, env.valid_actions)))
+            start_time = time.perf_counter()
+            _, _, done, _ = env.step(action)
+            step_durations.append(time.perf_counter() - start_time)
+
+    return {"reset": summarize(reset_durations), "step": summarize(step_durations)}
+
+
+# Latency with the estimated costs cleared (new partition sets) and cached (repeated partition sets).
+# With --persistent-cost-cache, the same requests are also measured with the persistent cost cache.
+def benchmark_cost_evaluation(benchmark, repetitions):
+    requests = [(benchmark.rnd.choice(benchmark.workloads), benchmark.random_partitions()) for _ in range(repetitions)]
+
+    settings = [("", None)]
+    if benchmark.arguments.persistent_cost_cache is not None:
+        settings.append(("_persistent", benchmark.arguments.persistent_cost_cache))
+
+    results = {}
+    for suffix, persistent_cache_path in settings:
+        cost_evaluation = CostEvaluation(
+            benchmark.connector, benchmark.all_partitions_flat, persistent_cache_path=persistent_cache_path
+        )
+        for workload in benchmark.workloads:
+            cost_evaluation.prefetch_plans(workload.queries)
+
+        uncached_durations = []
+        for workload, partitions in requests:
+            cost_evaluation.cache_estimated_costs.clear()
+            start_time = time.perf_counter()
+            cost_evaluation.calculate_cost_and_plans(workload, partitions)
+            uncached_durations.append(time.perf_counter() - start_time)
+
+        for workload, partitions in requests:
+            cost_evaluation.calculate_cost_and_plans(workload, partitions)
+        cached_durations = []
+        for workload, partitions in requests:
+            start_time = time.perf_counter()
+            cost_evaluation.calculate_cost_and_plans(workload, partitions)
+            cached_durations.append(time.perf_counter() - start_time)
+        cost_evaluation.complete_cost_estimation()
+
+        results[f"calculate_cost_and_plans_uncached{suffix}"] = summarize(uncached_durations)
+        results[f"calculate_cost_and_plans_cached{suffix}"] = summarize(cached_durations)
+    return results
+
+
+# Embeddings of whole workloads with a cleared and with a filled plan embedding cache
+def benchmark_embeddings(benchmark, repetitions):
+    embedder = benchmark.workload_embedder
+    # The environments pass the slim plans cached by CostEvaluation
+    plans_per_workload = [
+        [PlanNode.from_dict(benchmark.plans_by_text[query.text]) for query in workload.queries]
+        for workload in benchmark.workloads
+    ]
+
+    uncached_durations = []
+    cached_durations = []
+    for repetition in range(repetitions):
+        plans = plans_per_workload[repetition % len(plans_per_workload)]
+        embedder.plan_embedding_cache.clear()
+        start_time = time.perf_counter()
+        embedder.get_embeddings(plans)
+        uncached_durations.append(time.perf_counter() - start_time)
+
+        start_time = time.perf_counter()
+        embedder.get_embeddings(plans)
+        cached_durations.append(time.perf_counter() - start_time)
+
+    return {"get_embeddings_uncached": summarize(uncached_durations), "get_embeddings_cached": summarize(cached_durations)}
+
+
+def benchmark_action_masks(benchmark, repetitions):
+    action_manager = benchmark.make_action_manager()
+    rnd = random.Random(benchmark.arguments.seed)
+
+    initial_durations = []
+    update_durations = []
+    for repetition in range(repetitions):
+        workload = benchmark.workloads[repetition % len(benchmark.workloads)]
+        start_time = time.perf_counter()
+        valid_actions = action_manager.get_initial_valid_actions(workload)
+        initial_durations.append(time.perf_counter() - start_time)
+
+        for _ in range(benchmark.arguments.max_steps_per_episode):
+            allowed_actions = _allowed_actions(action_manager, valid_actions)
+            if len(allowed_actions) == 0:
+                break
+            start_time = time.perf_counter()
+            valid_actions, is_valid_action_left = action_manager.update_valid_actions(int(rnd.choice(allowed_actions)))
+            update_durations.append(time.perf_counter() - start_time)
+            if not is_valid_action_left:
+                break
+
+    return {"initial_valid_actions": summarize(initial_durations), "update_valid_actions": summarize(update_durations)}
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Benchmarks the environment's hot path on synthetic data.")
+    parser.add_argument("--tables", type=int, default=5)
+    parser.add_argument("--columns", type=int, default=8, help="Partitionable columns per table")
+    parser.add_argument("--query-classes", type=int, default=30)
+    parser.add_argument("--workload-size", type=int, default=10, help="Queries per workload")
+    parser.add_argument("--workloads", type=int, default=20)
+    parser.add_argument("--plan-depth", type=int, default=6)
+    parser.add_argument("--representation-size", type=int, default=20)
+    parser.add_argument("--max-steps-per-episode", type=int, default=20)
+    parser.add_argument("--episodes", type=int, default=50)
+    parser.add_argument("--repetitions", type=int, default=200)
+    parser.add_argument("--sb-version", type=int, default=2, choices=[2, 3])
+    parser.add_argument("--observation-dtype", default="float64")
+    parser.add_argument("--transition-cache", type=json.loads, default=None, help='e.g. \'{"max_entries": 10000}\'')
+    parser.add_argument("--prefetch-next-workload", action="store_true")
+    parser.add_argument(
+        "--persistent-cost-cache", help="SQLite file of a persistent cost cache, disabled by default like in experiments"
+    )
+    parser.add_argument("--seed", type=int, default=60)
+    parser.add_argument("--output", help="JSON file for the results, printed if omitted")
+    arguments = parser.parse_args()
+
+    assert arguments.workload_size <= arguments.query_classes, "Workloads cannot have more queries than classes."
+    return arguments
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.ERROR)
+    arguments = parse_arguments()
+
+    # Keeps stdout free for the JSON results
+    with contextlib.redirect_stdout(sys.stderr):
+        setup_start_time = time.perf_counter()
+        benchmark = SyntheticBenchmark(arguments)
+        setup_time = time.perf_counter() - setup_start_time
+
+    results = {}
+    results.update(benchmark_environment(benchmark, arguments.episodes))
+    results.update(benchmark_cost_evaluation(benchmark, arguments.repetitions))
+    results.update(benchmark_embeddings(benchmark, arguments.repetitions))
+    results.update(benchmark_action_masks(benchmark, arguments.repetitions))
+
+    report = {
+        "parameters": vars(arguments),
+        "platform": {"python": platform.python_version(), "numpy": np.__version__, "machine": platform.machine()},
+        "setup_seconds": setup_time,
+        "number_of_actions": len(benchmark.all_partitions_flat),
+        "results": results,
+    }
+
+    if arguments.output is None:
+        print(json.dumps(report, indent=2))
+    else:
+        with open(arguments.output, "w") as handle:
+            json.dump(report, handle, indent=2)
+        for name, result in results.items():
+            print(f"{name + ':':<46}{result['mean_ms']:8.3f} ms mean, {result['p95_ms']:8.3f} ms p95")
@@ -0,0 +1,242 @@
+import gzip
+import json
+import pickle
+import sqlite3
+import sys
+import time
+
+import pyparsing as pp
+from pyparsing import (
+    CaselessKeyword,
+    Forward,
+    Group,
+    ParserElement,
+    Word,
+    alphanums,
+    alphas,
+    delimitedList,
+    infixNotation,
+    oneOf,
+    opAssoc,
+    quotedString,
+    restOfLine,
+)
+from pyparsing import pyparsing_common as ppc
+
+from SWPRL import utils
+from SWPRL.expression_parser import ExpressionParser
+
+# Compares the hand-written ExpressionParser with the former pyparsing grammar on the
+# Filter and Index Cond expressions of real plans. Plans are harvested from a persistent
+# cost cache (*.sqlite) or from pickled cost estimation caches (caches.pickle.gzip).
+#
+# Usage: python -m SWPRL.scripts.benchmark_expression_parser <cache_file> [repetitions]
+
+FILTER_ATTRIBUTES = ["Filter", "Index Cond"]
+
+
+# The former pyparsing grammar, without the interactive breakpoint on parse errors
+class LegacyExpressionParser:
+    def __init__(self):
+        ParserElement.enablePackrat()
+
+        # define SQL tokens
+        selectStmt = Forward()
+        whereStmt = Forward()
+        SELECT, FROM, WHERE, AND, OR, IN, IS, NOT, NULL, ANY = map(
+            CaselessKeyword, "select from where and or in is not null any".split()
+        )
+        NOT_NULL = NOT + NULL
+
+        ident = Word(alphas, alphanums + "_$").setName("identifier")
+        columnName = delimitedList(ident, ".", combine=True).setName("column name")
+        columnName.addParseAction(ppc.upcaseTokens)
+        columnNameList = Group(delimitedList(columnName).setName("column_list"))
+        tableName = delimitedList(ident, ".", combine=True).setName("table name")
+        tableName.addParseAction(ppc.upcaseTokens)
+        tableNameList = Group(delimitedList(tableName).setName("table_list"))
+
+        binop = oneOf("= != < > >= <= eq ne lt le gt ge", caseless=True).setName("binop")
+        realNum = ppc.real().setName("real number")
+        intNum = ppc.signed_integer()
+        types = oneOf("bpchar text date timestamp interval numeric bigint text[]")
+        delimitor = oneOf("::")
+        value = quotedString + delimitor.suppress() + types.suppress()
+        left_para = oneOf("(")
+        right_para = oneOf(")")
+        left_para_array = oneOf("('{")
+        right_para_array = oneOf("}'")
+
+        columnRval = (
+            realNum | intNum | value | columnName | left_para.suppress() + columnName + right_para.suppress() + delimitor.suppress() + types.suppress()
+        ).setName("column_rvalue")  # need to add support for alg expressions
+        whereCondition = Group(
+            (columnName + binop + columnRval)
+            | (left_para.suppress() + columnName + right_para.suppress() + delimitor.suppress() + types.suppress() + binop + ANY + (left_para_array.suppress() + delimitedList(columnRval).setName("any_values_list") + right_para_array.suppress() + delimitor.suppress() + types.suppress() + right_para.suppress()))
+            | (left_para.suppress() + columnName + right_para.suppress() + delimitor.suppress() + types.suppress() + binop + columnRval)
+            | (columnName + IN + Group("(" + delimitedList(columnRval).setName("in_values_list") + ")"))
+            | (columnName + IN + Group("(" + selectStmt + ")"))
+            | (columnName + IS + (NULL | NOT_NULL))
+        ).setName("where_condition")
+
+        whereExpression = infixNotation(
+            whereCondition,
+            [
+                (NOT, 1, opAssoc.RIGHT),
+                (AND, 2, opAssoc.LEFT),
+                (OR, 2, opAssoc.LEFT),
+            ],
+        ).setName("where_expression")
+
+        # define the grammar
+        # selectStmt <<= (
+        #     SELECT
+        #     + ("*" | columnNameList)("columns")
+        #     + FROM
+        #     + tableNameList("tables")
+        #     + Optional(Group(WHERE + whereExpression), "")("where")
+        # ).setName("select_statement")
+
+        whereStmt <<= (
+            (left_para.suppress() + whereExpression + right_para.suppress()) | whereExpression
+        ).setName("where_statement")
+
+        self.parser = whereStmt
+
+        # define comment format, and ignore them
+        SqlComment = "--" + restOfLine
+        self.parser.ignore(SqlComment)
+
+    def parse(self, expression):
+        try:
+            return self.parser.parseString(expression, parseAll=True)
+        except pp.ParseException:
+            return None
+
+
+# Interval extraction of the former CostEvaluation, operating on the pyparsing results
+def legacy_intervals(parser, expression):
+    parsed_expression = parser.parse(expression)
+    if parsed_expression is None:
+        return None
+    parsed_expression = parsed_expression[0]
+    try:
+        if parsed_expression[2] == "any":
+            return legacy_interval_any(parsed_expression)
+        return legacy_interval(parsed_expression.asList(), {})
+    except Exception:
+        return None
+
+
+def legacy_interval(expression, interval):
+    op = expression[1]
+    if op == "AND" or op == "and":
+        *_, (e1, i1) = legacy_interval(expression[0], interval).items()
+        *_, (e2, i2) = legacy_interval(expression[2], interval).items()
+        if e1 == e2:
+            interval[e1] = utils.intersect_intervals(i1, i2)
+        else:
+            interval[e1] = i1
+            interval[e2] = i2
+    elif op == "OR" or op == "or":
+        *_, (e1, i1) = legacy_interval(expression[0], interval).items()
+        *_, (e2, i2) = legacy_interval(expression[2], interval).items()
+        if e1 == e2:
+            interval[e1] = utils.union_intervals(i1, i2)
+        else:
+            interval[e1] = i1
+            interval[e2] = i2
+    else:
+        op = expression[1]
+        val = expression[2]
+        if isinstance(val, str) and (
+            (val.startswith('"') and val.endswith('"')) or (val.startswith("'") and val.endswith("'"))
+        ):
+            val = val[1:-1]
+        if op == "=":
+            i = (val, val)
+        elif op == "<" or op == "<=":
+            i = (None, val)
+        elif op == ">" or op == ">=":
+            i = (val, None)
+        else:
+            raise NotImplementedError(f"Operator not supported - {op}")
+        interval[expression[0].lower()] = i
+
+    return interval
+
+
+def legacy_interval_any(expression):
+    e = expression[0]
+    expressions = expression[3:]
+    expressions.sort()
+
+    return {e.lower(): (f"'{expressions[0]}'", f"'{expressions[-1]}'")}
+
+
+def plans_from_cache_file(path):
+    if path.endswith(".sqlite"):
+        connection = sqlite3.connect(path)
+        rows = connection.execute("SELECT plan FROM plans;").fetchall()
+        connection.close()
+        return [json.loads(row[0]) for row in rows]
+
+    with gzip.open(path, "rb") as handle:
+        cache = pickle.load(handle)
+    return [value[1] for value in cache.values()]
+
+
+def harvest_filters(plans):
+    filters = set()
+    nodes = list(plans)
+    while nodes:
+        node = nodes.pop()
+        for attribute in FILTER_ATTRIBUTES:
+            if attribute in node:
+                filters.add(node[attribute])
+        nodes.extend(node.get("Plans", []))
+    return sorted(filters)
+
+
+def time_parser(parse_function, filters, repetitions):
+    results = None
+    start_time = time.perf_counter()
+    for _ in range(repetitions):
+        results = [parse_function(query_filter) for query_filter in filters]
+    return (time.perf_counter() - start_time) / repetitions, results
+
+
+if __name__ == "__main__":
+    assert len(sys.argv) >= 2, "A cache file must be provided: benchmark_expression_parser.py path_to_cache [repetitions]"
+    CACHE_FILE = sys.argv[1]
+    REPETITIONS = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+
+    filters = harvest_filters(plans_from_cache_file(CACHE_FILE))
+    print(f"Harvested {len(filters)} distinct filters from {CACHE_FILE}.")
+
+    legacy_parser = LegacyExpressionParser()
+    parser = ExpressionParser()
+
+    def legacy_parse(query_filter):
+        # Packrat results must not be reused across repetitions
+        ParserElement.resetCache()
+        return legacy_intervals(legacy_parser, query_filter)
+
+    legacy_time, legacy_results = time_parser(legacy_parse, filters, REPETITIONS)
+    new_time, new_results = time_parser(parser.intervals, filters, REPETITIONS)
+
+    legacy_failures = sum(1 for result in legacy_results if result is None)
+    no_information = sum(1 for result in new_results if len(result) == 0)
+    mismatches = [
+        (query_filter, legacy_result, new_result)
+        for query_filter, legacy_result, new_result in zip(filters, legacy_results, new_results)
+        if legacy_result is not None and legacy_result != new_result
+    ]
+
+    print(f"pyparsing:   {legacy_time * 1000:.2f} ms per pass, {legacy_failures} failures")
+    print(f"hand-written: {new_time * 1000:.2f} ms per pass, {no_information} without pruning information")
+    if new_time > 0:
+        print(f"Speedup:     {legacy_time / new_time:.1f}x")
+    print(f"Differing intervals: {len(mismatches)}")
+    for query_filter, legacy_result, new_result in mismatches:
+        print(f"    {query_filter}\n        pyparsing: {legacy_result}\n        hand-written: {new_result}")
@@ -91,23 +91,44 @@ def all_partitions_from_columns(columns):
     print(f"Generating all partitions for {len(columns)} tables.")
 
     partitions = []
+    # Ids follow the flattened order, i.e., a partition's id equals its action index
+    partition_id = 0
     for table in columns:
         tables = []
         for column in table:
             columns = []
             if column.is_date():
                 for partition_rate in ["daily", "weekly", "monthly", "yearly"]:
-                    columns.append(Partition(column, partition_rate))
+                    columns.append(Partition(column, partition_rate, partition_id=partition_id))
+                    partition_id += 1
             else:
                 for upper_bound in range(1,10):
-                    columns.append(Partition(column, upper_bound/10))
-            columns.append(Partition(column, no_more_partitions=True))
+                    columns.append(Partition(column, upper_bound/10, partition_id=partition_id))
+                    partition_id += 1
+            columns.append(Partition(column, no_more_partitions=True, partition_id=partition_id))
+            partition_id += 1
             tables.append(columns)
         partitions.append(tables)
     
     return partitions
 
 
+def partitions_to_bitmask(partitions):
+    bitmask = 0
+    for partition in partitions:
+        bitmask |= 1 << partition.id
+    return bitmask
+
+
+def partitions_from_bitmask(bitmask, all_partitions_flat):
+    partitions = []
+    while bitmask:
+        lowest_bit = bitmask & -bitmask
+        partitions.append(all_partitions_flat[lowest_bit.bit_length() - 1])
+        bitmask ^= lowest_bit
+    return partitions
+
+
 def intersect_intervals(interval1, interval2):
     if interval1[0] is None:
         minimum = interval2[0]
@@ -141,9 +162,11 @@ def union_intervals(interval1, interval2):
     return (minimum, maximum)
 
 
-def output_partitions(partitions, database_name, path):
-    connector = PostgresDatabaseConnector(database_name, autocommit=True)
-    cost_evaluation = CostEvaluation(connector)
+def output_partitions(
+    partitions, database_name, path, persistent_cost_cache=None, connector_factory=PostgresDatabaseConnector
+):
+    connector = connector_factory(database_name, autocommit=True)
+    cost_evaluation = CostEvaluation(connector, persistent_cache_path=persistent_cost_cache)
     print("\n------------------------------------\n\nRecommendations:")
     partitions_by_table = {}
     for p in partitions:
@@ -1,18 +1,55 @@
+import collections
+import functools
+import hashlib
 import logging
 
 import gensim
+import numpy as np
+import scipy.sparse
 from sklearn.decomposition import PCA
 
 from SWPRL.cost_evaluation import CostEvaluation
 from index_selection_evaluation.selection.index import Index
 from index_selection_evaluation.selection.workload import Query
 from SWPRL.partition import Partition
+from SWPRL.plan import PlanNode
 
 from .boo import BagOfOperators
+from .lru_cache import LRUCache
+
+
+# Stacks (term id, count) lists into a sparse (documents x number_of_terms) matrix
+def bow_matrix(bows, number_of_terms, dtype):
+    rows = []
+    term_ids = []
+    counts = []
+    for row, bow in enumerate(bows):
+        for term_id, count in bow:
+            rows.append(row)
+            term_ids.append(term_id)
+            counts.append(count)
+    return scipy.sparse.csr_matrix((counts, (rows, term_ids)), shape=(len(bows), number_of_terms), dtype=dtype)
+
+
+# Feature index and sign of an operator. Unlike hash(), which is salted per process, the result is stable
+# across processes and runs.
+@functools.lru_cache(maxsize=65536)
+def hash_operator(operator, number_of_features):
+    digest = int.from_bytes(hashlib.blake2b(operator.encode("utf-8"), digest_size=8).digest(), "little")
+    return digest % number_of_features, 1 if digest >> 63 else -1
 
 
 class WorkloadEmbedder(object):
-    def __init__(self, query_texts, representation_size, database_connector, columns=None, retrieve_plans=False):
+    def __init__(
+        self,
+        query_texts,
+        representation_size,
+        database_connector,
+        columns=None,
+        retrieve_plans=False,
+        persistent_cost_cache=None,
+        cache_limits=None,
+    ):
         self.STOPTOKENS = [
             "as",
             "and",
@@ -43,6 +80,8 @@ class WorkloadEmbedder(object):
         self.representation_size = representation_size
         self.database_connector = database_connector
         self.plans = None
+        # Incremented whenever the embeddings of already embedded plans change, e.g., by online updates
+        self.model_version = 0
         self.columns = columns
         self.columns_by_table = []
 
@@ -59,11 +98,14 @@ class WorkloadEmbedder(object):
         # [without partitions], [with partitions]
         self.plans = ([], [])
         if retrieve_plans:
-            cost_evaluation = CostEvaluation(self.database_connector)            
-            for query_idx, query_texts_per_query_class in enumerate(query_texts):
-                query_text = query_texts_per_query_class[0]
-                query = Query(query_idx, query_text)
-                plan = self.database_connector.get_plan(query)
+            cost_evaluation = CostEvaluation(self.database_connector, persistent_cache_path=persistent_cost_cache)
+            queries = [
+                Query(query_idx, query_texts_per_query_class[0])
+                for query_idx, query_texts_per_query_class in enumerate(query_texts)
+            ]
+            cost_evaluation.prefetch_plans(queries)
+            for query in queries:
+                _, plan = cost_evaluation._request_cache_plans(query)
                 self.plans[0].append(plan)
 
             # logging.critical(f"Creating all partitions of width 1.")
@@ -104,12 +146,33 @@ class WorkloadEmbedder(object):
 
 
 class PlanEmbedder(WorkloadEmbedder):
-    def __init__(self, query_texts, representation_size, database_connector, columns, without_partitions=True):
+    def __init__(
+        self,
+        query_texts,
+        representation_size,
+        database_connector,
+        columns,
+        without_partitions=True,
+        persistent_cost_cache=None,
+        cache_limits=None,
+        online_update=False,
+        fit_corpus=True,
+    ):
         WorkloadEmbedder.__init__(
-            self, query_texts, representation_size, database_connector, columns, retrieve_plans=True
+            self,
+            query_texts,
+            representation_size,
+            database_connector,
+            columns,
+            retrieve_plans=fit_corpus,
+            persistent_cost_cache=persistent_cost_cache,
         )
 
-        self.plan_embedding_cache = {}
+        cache_limits = cache_limits or {}
+        self.plan_embedding_cache = LRUCache.from_limits(cache_limits.get("plan_embeddings"))
+        # If True, plans with operators that are not in the dictionary update the model instead of the operators
+        # being dropped
+        self.online_update = online_update
 
         self.relevant_operators = []
         self.relevant_operators_wo_partitions = []
@@ -117,6 +180,11 @@ class PlanEmbedder(WorkloadEmbedder):
 
         self.boo_creator = BagOfOperators()
 
+        # Embedders without a corpus, e.g., hashed ones, need neither plans nor a dictionary
+        if not fit_corpus:
+            self._create_model()
+            return
+
         for plan in self.plans[0]:
             boo = self.boo_creator.boo_from_plan(plan)
             self.relevant_operators.append(boo)
@@ -133,7 +201,7 @@ class PlanEmbedder(WorkloadEmbedder):
 
         self.dictionary = gensim.corpora.Dictionary(self.relevant_operators)
         logging.warning(f"Dictionary has {len(self.dictionary)} entries.")
-        self.bow_corpus = [self.dictionary.doc2bow(query) for query in self.relevant_operators]
+        self.bow_corpus = [self._bow_from_boo(query) for query in self.relevant_operators]
 
         self._create_model()
 
@@ -143,41 +211,127 @@ class PlanEmbedder(WorkloadEmbedder):
     def _create_model(self):
         raise NotImplementedError
 
-    def _infer(self, bow, boo):
+    # Trains the model further with the bags of words of new documents, whose terms were added to the dictionary
+    def _update_model(self, bows):
         raise NotImplementedError
 
-    def get_embeddings(self, plans):
-        embeddings = []
+    # Same result as Dictionary.doc2bow: counts the dictionary's integer ids of the known operators
+    def _bow_from_boo(self, boo):
+        token_ids = self.dictionary.token2id
+        return sorted(collections.Counter([token_ids[operator] for operator in boo if operator in token_ids]).items())
 
-        for plan in plans:
-            cache_key = str(plan)
-            if cache_key not in self.plan_embedding_cache:
-                boo = self.boo_creator.boo_from_plan(plan)
-                bow = self.dictionary.doc2bow(boo)
+    def _infer(self, bow, boo):
+        raise NotImplementedError
 
-                vector = self._infer(bow, boo)
+    # Embeddings of several plans as a (plans x representation_size) array
+    def _infer_batch(self, bows, boos):
+        return np.array([self._infer(bow, boo) for bow, boo in zip(bows, boos)], dtype=np.float64)
 
-                self.plan_embedding_cache[cache_key] = vector
+    # Returns a (plans x representation_size) array. Only plans that miss the cache are embedded, in one batch.
+    def get_embeddings(self, plans):
+        embeddings = np.empty((len(plans), self.representation_size))
+
+        # {fingerprint: [positions of the plan]}
+        missing_plans = {}
+        missing_positions = {}
+        for position, plan in enumerate(plans):
+            # Plan nodes carry a precomputed structural fingerprint
+            cache_key = PlanNode.from_dict(plan).fingerprint
+            vector = self.plan_embedding_cache.get(cache_key)
+            if vector is not None:
+                embeddings[position] = vector
+            elif cache_key in missing_positions:
+                missing_positions[cache_key].append(position)
             else:
-                vector = self.plan_embedding_cache[cache_key]
-
-            embeddings.append(vector)
+                missing_plans[cache_key] = plan
+                missing_positions[cache_key] = [position]
+
+        if len(missing_plans) > 0:
+            boos = [self.boo_creator.boo_from_plan(plan) for plan in missing_plans.values()]
+            if self.online_update and self._add_unknown_operators(boos):
+                # All embeddings, including the cached ones, are recomputed with the updated model
+                return self.get_embeddings(plans)
+            bows = [self._bow_from_boo(boo) for boo in boos]
+            vectors = self._infer_batch(bows, boos)
+
+            for cache_key, vector in zip(missing_plans, vectors):
+                # Copies do not keep the whole batch alive
+                self.plan_embedding_cache[cache_key] = vector.copy()
+                embeddings[missing_positions[cache_key]] = vector
 
         return embeddings
 
+    # Adds the bags of operators that contain unknown operators to the dictionary and the model.
+    # Returns whether the model changed.
+    def _add_unknown_operators(self, boos):
+        token_ids = self.dictionary.token2id
+        new_documents = [boo for boo in boos if any(operator not in token_ids for operator in boo)]
+        if len(new_documents) == 0:
+            return False
+
+        number_of_terms = len(self.dictionary)
+        self.dictionary.add_documents(new_documents)
+        self._update_model([self._bow_from_boo(boo) for boo in new_documents])
+
+        self.plan_embedding_cache.clear()
+        self.model_version += 1
+        logging.info(
+            f"Updated the plan embedder with {len(new_documents)} plans and "
+            f"{len(self.dictionary) - number_of_terms} new operators."
+        )
+        return True
+
+
 class PlanEmbedderLSIBOW(PlanEmbedder):
-    def __init__(self, query_texts, representation_size, database_connector, columns, without_partitions=False):
-        PlanEmbedder.__init__(self, query_texts, representation_size, database_connector, columns, without_partitions)
+    def __init__(
+        self,
+        query_texts,
+        representation_size,
+        database_connector,
+        columns,
+        without_partitions=False,
+        persistent_cost_cache=None,
+        cache_limits=None,
+        online_update=False,
+        random_seed=None,
+    ):
+        # Seeds gensim's randomized decomposition, the fitted model is only reproducible if set
+        self.random_seed = random_seed
+
+        PlanEmbedder.__init__(
+            self,
+            query_texts,
+            representation_size,
+            database_connector,
+            columns,
+            without_partitions,
+            persistent_cost_cache=persistent_cost_cache,
+            cache_limits=cache_limits,
+            online_update=online_update,
+        )
 
     def _create_model(self):
         self.lsi_bow = gensim.models.LsiModel(
-            self.bow_corpus, id2word=self.dictionary, num_topics=self.representation_size
+            self.bow_corpus, id2word=self.dictionary, num_topics=self.representation_size, random_seed=self.random_seed
         )
+        self._extract_projection()
 
         # assert (
         #     len(self.lsi_bow.get_topics()) == self.representation_size
         # ), f"Topic-representation_size mismatch: {len(self.lsi_bow.get_topics())} vs {self.representation_size}"
 
+    # The projection gets zero rows for the dictionary's new terms before gensim merges the new documents into it.
+    # The number of topics, i.e., the representation size, stays the same.
+    def _update_model(self, bows):
+        projection = self.lsi_bow.projection
+        new_terms = len(self.dictionary) - projection.m
+        projection.u = np.vstack([projection.u, np.zeros((new_terms, projection.u.shape[1]), dtype=projection.u.dtype)])
+        projection.m = len(self.dictionary)
+        self.lsi_bow.num_terms = len(self.dictionary)
+
+        self.lsi_bow.add_documents(bows)
+        self._extract_projection()
+
     def _infer(self, bow, boo):
         result = self.lsi_bow[bow]
 
@@ -190,3 +344,87 @@ class PlanEmbedderLSIBOW(PlanEmbedder):
         assert len(vector) == self.representation_size
 
         return vector
+
+    # lsi_bow[bow] multiplies the bag-of-words vector with the first num_topics columns of the projection's
+    # left singular vectors. Topics beyond the trained ones are zero, like in _infer.
+    def _extract_projection(self):
+        projection = self.lsi_bow.projection.u[:, : self.lsi_bow.num_topics]
+        self.projection = np.zeros((projection.shape[0], self.representation_size), dtype=projection.dtype)
+        self.projection[:, : projection.shape[1]] = projection
+
+    # Stacks the bag-of-words vectors into a sparse matrix and projects all of them with one multiplication
+    def _infer_batch(self, bows, boos):
+        bows = bow_matrix(bows, self.projection.shape[0], self.projection.dtype)
+
+        vectors = np.asarray(bows @ self.projection, dtype=np.float64)
+        # gensim drops topics with absolute values of at most 1e-9 from its sparse results
+        vectors[np.abs(vectors) <= 1e-9] = 0
+        return vectors
+
+
+# Embeds plans without a corpus, a dictionary, or training, hence, without retrieving plans at construction.
+# The operators of the bag of operators are hashed to number_of_features signed features, which a fixed random
+# sparse projection, seeded with seed, maps to representation_size dimensions. Every feature contributes to
+# about the square root of representation_size dimensions. Operators of query templates that were unknown
+# at construction are embedded like all others.
+class PlanEmbedderHashedRandomProjection(PlanEmbedder):
+    def __init__(
+        self,
+        query_texts,
+        representation_size,
+        database_connector,
+        columns,
+        number_of_features=2**14,
+        seed=0,
+        persistent_cost_cache=None,
+        cache_limits=None,
+        online_update=False,
+    ):
+        if online_update:
+            raise ValueError(
+                "PlanEmbedderHashedRandomProjection embeds unknown operators without updates, "
+                "online_update is not supported."
+            )
+
+        self.number_of_features = number_of_features
+        self.seed = seed
+
+        PlanEmbedder.__init__(
+            self,
+            query_texts,
+            representation_size,
+            database_connector,
+            columns,
+            persistent_cost_cache=persistent_cost_cache,
+            cache_limits=cache_limits,
+            fit_corpus=False,
+        )
+
+    def _create_model(self):
+        random_generator = np.random.default_rng(self.seed)
+        nonzeros_per_feature = min(self.representation_size, int(np.ceil(np.sqrt(self.representation_size))))
+
+        # A random subset of dimensions per feature with random signs, scaled to preserve norms in expectation
+        dimensions = np.argsort(
+            random_generator.random((self.number_of_features, self.representation_size)), axis=1
+        )[:, :nonzeros_per_feature]
+        signs = random_generator.choice([-1.0, 1.0], size=dimensions.shape)
+        features = np.repeat(np.arange(self.number_of_features), nonzeros_per_feature)
+        self.projection = scipy.sparse.csr_matrix(
+            (signs.ravel() / np.sqrt(nonzeros_per_feature), (features, dimensions.ravel())),
+            shape=(self.number_of_features, self.representation_size),
+        )
+
+    # Signed counts of the hashed features instead of dictionary ids
+    def _bow_from_boo(self, boo):
+        features = collections.Counter()
+        for operator in boo:
+            feature, sign = hash_operator(operator, self.number_of_features)
+            features[feature] += sign
+        return sorted(features.items())
+
+    def _infer(self, bow, boo):
+        return self._infer_batch([bow], [boo])[0]
+
+    def _infer_batch(self, bows, boos):
+        return (bow_matrix(bows, self.number_of_features, self.projection.dtype) @ self.projection).toarray()
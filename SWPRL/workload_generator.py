@@ -21,7 +21,13 @@ QUERY_PATH = "query_files"
 
 class WorkloadGenerator(object):
     def __init__(
-        self, config, workload_tables, random_seed, database_name, experiment_id=None
+        self,
+        config,
+        workload_tables,
+        random_seed,
+        database_name,
+        experiment_id=None,
+        connector_factory=PostgresDatabaseConnector,
     ):
         assert config["benchmark"] in [
             "TPCH",
@@ -42,6 +48,7 @@ class WorkloadGenerator(object):
         self.workload_tables = workload_tables
         self.workload_columns = [column for table in workload_tables for column in table.columns]
         self.database_name = database_name
+        self.connector_factory = connector_factory
 
         self.benchmark = config["benchmark"]
         self.number_of_query_classes = self._set_number_of_query_classes()
@@ -83,7 +90,7 @@ class WorkloadGenerator(object):
                 config["validation_testing"]["unknown_query_probabilities"][-1] > 0
             ), "Query unknown_query_probabilities should be larger 0."
 
-            embedder_connector = PostgresDatabaseConnector(self.database_name, autocommit=True)
+            embedder_connector = self.connector_factory(self.database_name, autocommit=True)
             embedder = WorkloadEmbedder(
                 # Transform globally_partitionable_columns to list of lists.
                 self.query_texts,
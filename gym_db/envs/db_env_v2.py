@@ -1,19 +1,50 @@
 import collections
 import copy
+import datetime
 import logging
 import random
+from concurrent.futures import ThreadPoolExecutor
 
 import gym
 
 from gym_db.common import EnvironmentType
+from SWPRL import utils
+from SWPRL.async_plan_fetcher import AsyncPlanFetcher
 from SWPRL.cost_evaluation import CostEvaluation
-from index_selection_evaluation.selection.dbms.postgres_dbms import PostgresDatabaseConnector
+from SWPRL.lru_cache import LRUCache
+from SWPRL.replay_connector import RecordingConnector
 from SWPRL.partition import Partition
 from index_selection_evaluation.selection.utils import b_to_mb
 
+# Number of resets between two log messages about the caches' sizes
+CACHE_REPORT_FREQUENCY = 100
+
+
+def create_cost_evaluation(config, connector):
+    plan_fetcher = None
+    if config["plan_fetch_concurrency"] > 1:
+        plan_fetcher = AsyncPlanFetcher(
+            config["database_name"], config["plan_fetch_concurrency"], connector_factory=config["connector_factory"]
+        )
+    return CostEvaluation(
+        connector,
+        config["all_partitions_flat"],
+        persistent_cache_path=config["persistent_cost_cache"],
+        plan_fetcher=plan_fetcher,
+        cache_limits=config["cache_limits"],
+    )
+
 
 class DBEnvV2(gym.Env):
-    def __init__(self, environment_type=EnvironmentType.TRAINING, config=None):
+    # A shared cost_evaluation (and its connection) can be passed in, e.g., by DBVecEnvV2. Then, only the
+    # environments with reports_cost_evaluation report its statistics to avoid counting them repeatedly.
+    def __init__(
+        self,
+        environment_type=EnvironmentType.TRAINING,
+        config=None,
+        cost_evaluation=None,
+        reports_cost_evaluation=True,
+    ):
         super(DBEnvV2, self).__init__()
 
         self.rnd = random.Random()
@@ -25,9 +56,16 @@ class DBEnvV2(gym.Env):
         self.number_of_resets = 0
         self.total_number_of_steps = 0
 
-        self.connector = PostgresDatabaseConnector(config["database_name"], autocommit=True)
+        if cost_evaluation is None:
+            self.connector = config["connector_factory"](config["database_name"], autocommit=True)
+            cost_evaluation = create_cost_evaluation(config, self.connector)
+            self.owns_connector = True
+        else:
+            self.connector = cost_evaluation.db_connector
+            self.owns_connector = False
 #        self.connector.drop_indexes()
-        self.cost_evaluation = CostEvaluation(self.connector)
+        self.cost_evaluation = cost_evaluation
+        self.reports_cost_evaluation = reports_cost_evaluation
 
         self.globally_partitionable_columns_flat = config["globally_partitionable_columns_flat"]
 
@@ -49,6 +87,36 @@ class DBEnvV2(gym.Env):
 
         self.reward_calculator = config["reward_calculator"]
 
+        # Optional memoization of steps: {(workload, partitions bitmask, action): (costs and plans, observation)}
+        # The action is part of the key since observations show the action status before the last action.
+        # Workloads are created once before training, i.e., their ids identify them.
+        self.transition_cache = None
+        if config["transition_cache"] is not None:
+            self.transition_cache = LRUCache.from_limits(config["transition_cache"])
+        self.transition_requests = 0
+        self.transition_hits = 0
+        # Optional preallocated array that observations are written into, see DBVecEnvV2
+        self.observation_out = None
+
+        # Optionally, the plans and percentiles of the next episode's workload are fetched in a background
+        # thread with its own connection and cost evaluation while the current episode runs
+        self.prefetch_executor = None
+        if config.get("prefetch_next_workload", False):
+            self.prefetch_executor = ThreadPoolExecutor(max_workers=1)
+        self.prefetch_cost_evaluation = None
+        self.prefetch_future = None
+        self.next_workload = None
+        self.partitioned_columns = frozenset(partition.column for partition in self.all_partitions_flat)
+
+        # Costs, plans, and observation without partitions per workload: {id(workload): (costs and plans, observation)}
+        # Workloads that are consumed (similar_workloads) are not repeated, observation managers that keep the first
+        # embedding of an episode (UPDATE_EMBEDDING_PER_OBSERVATION = False) need the initial plans.
+        self.initial_state_cache = None
+        if not self.similar_workloads and getattr(self.observation_manager, "UPDATE_EMBEDDING_PER_OBSERVATION", True):
+            self.initial_state_cache = {}
+        # Model version of the workload embedder that the cached observations were created with
+        self.embedder_version = self._workload_embedder_version()
+
         self._init_modifiable_state()
 
         if self.environment_type != environment_type.TRAINING:
@@ -58,6 +126,9 @@ class DBEnvV2(gym.Env):
         self.number_of_resets += 1
         self.total_number_of_steps += self.steps_taken
 
+        if self.number_of_resets % CACHE_REPORT_FREQUENCY == 0:
+            self._log_cache_info()
+
         initial_observation = self._init_modifiable_state()
 
         return initial_observation
@@ -68,7 +139,7 @@ class DBEnvV2(gym.Env):
             self.valid_actions[action] == self.action_manager.ALLOWED_ACTION
         ), f"Agent has chosen invalid action: {action} - {self.all_partitions_flat[action]}"
         assert (
-            self.all_partitions_flat[action] not in self.current_partitions
+            not self.current_partitions >> self.all_partitions_flat[action].id & 1
         ), f"{self.all_partitions_flat[action]} already in self.current_partitions"
 
     def step(self, action):
@@ -77,12 +148,19 @@ class DBEnvV2(gym.Env):
         self.steps_taken += 1
 
         new_partition = self.all_partitions_flat[action]
-        self.current_partitions.add(new_partition)
-
-        environment_state = self._update_return_env_state(
-            init=False, new_partition=new_partition
-        )
-        current_observation = self.observation_manager.get_observation(environment_state)
+        self.current_partitions |= 1 << new_partition.id
+
+        transition = self._lookup_transition(action)
+        if transition is None:
+            environment_state = self._update_return_env_state(
+                init=False, new_partition=new_partition
+            )
+            current_observation = self.observation_manager.get_observation(environment_state, out=self.observation_out)
+            self._store_transition(action, current_observation)
+        else:
+            cost_and_plans, observation = transition
+            environment_state = self._update_return_env_state(init=False, cost_and_plans=cost_and_plans)
+            current_observation = self._copy_observation(observation)
 
         self.valid_actions, is_valid_action_left = self.action_manager.update_valid_actions(
             action
@@ -94,7 +172,7 @@ class DBEnvV2(gym.Env):
         if episode_done and self.environment_type != EnvironmentType.TRAINING:
             self._report_episode_performance(environment_state)
             self.current_workload_idx += 1
-            print(f"Partitions: {self.current_partitions}")
+            print(f"Partitions: {utils.partitions_from_bitmask(self.current_partitions, self.all_partitions_flat)}")
 
         return current_observation, reward, episode_done, {"action_mask": self.valid_actions}
 
@@ -102,7 +180,7 @@ class DBEnvV2(gym.Env):
         episode_performance = {
             "achieved_cost": self.current_costs / self.initial_costs * 100,
             "evaluated_workload": self.current_workload,
-            "partitions": self.current_partitions,
+            "partitions": utils.partitions_from_bitmask(self.current_partitions, self.all_partitions_flat),
         }
 
         output = (
@@ -115,26 +193,31 @@ class DBEnvV2(gym.Env):
         self.episode_performances.append(episode_performance)
 
     def _init_modifiable_state(self):
-        self.current_partitions = set()
+        # Bitmask over the partitions' ids
+        self.current_partitions = 0
         self.steps_taken = 0
         self.reward_calculator.reset()
 
         if len(self.workloads) == 0:
             self.workloads = copy.copy(self.config["workloads"])
 
-        if self.environment_type == EnvironmentType.TRAINING:
-            if self.similar_workloads:
-                # 200 is an arbitrary value
-                self.current_workload = self.workloads.pop(0 + self.env_id * 200)
-            else:
-                self.current_workload = self.rnd.choice(self.workloads)
-        else:
-            self.current_workload = self.workloads[self.current_workload_idx % len(self.workloads)]
+        self.current_workload = self._choose_workload()
 
         self.previous_cost = None
 
+        self._merge_prefetched_workload()
+
         self.valid_actions = self.action_manager.get_initial_valid_actions(self.current_workload)
-        environment_state = self._update_return_env_state(init=True)
+        self._discard_stale_observations()
+        initial_state = None
+        if self.initial_state_cache is not None:
+            initial_state = self.initial_state_cache.get(id(self.current_workload))
+
+        if initial_state is None:
+            self.cost_evaluation.prefetch_plans(self.current_workload.queries)
+            environment_state = self._update_return_env_state(init=True)
+        else:
+            environment_state = self._update_return_env_state(init=True, cost_and_plans=initial_state[0])
 
         state_fix_for_episode = {
             "workload": self.current_workload,
@@ -142,15 +225,161 @@ class DBEnvV2(gym.Env):
         }
         self.observation_manager.init_episode(state_fix_for_episode)
 
-        initial_observation = self.observation_manager.get_observation(environment_state)
+        if initial_state is None:
+            initial_observation = self.observation_manager.get_observation(environment_state, out=self.observation_out)
+            if self.initial_state_cache is not None:
+                cost_and_plans = (self.current_costs, self.current_plans_per_query, self.current_costs_per_query)
+                self.initial_state_cache[id(self.current_workload)] = (cost_and_plans, initial_observation.copy())
+        else:
+            initial_observation = self._copy_observation(initial_state[1])
+
+        if self.prefetch_executor is not None:
+            self._prefetch_next_workload()
 
         return initial_observation
 
-    def _update_return_env_state(self, init, new_partition=None):
-        total_costs, plans_per_query, costs_per_query = self.cost_evaluation.calculate_cost_and_plans(
-            self.current_workload, self.current_partitions
+    def _choose_workload(self):
+        if self.environment_type == EnvironmentType.TRAINING:
+            if self.similar_workloads:
+                # 200 is an arbitrary value
+                return self.workloads.pop(0 + self.env_id * 200)
+            if self.next_workload is not None:
+                workload = self.next_workload
+                self.next_workload = None
+                return workload
+            return self.rnd.choice(self.workloads)
+        return self.workloads[self.current_workload_idx % len(self.workloads)]
+
+    # Random choices are drawn one episode in advance, which keeps the sequence of workloads unchanged.
+    # Otherwise, the prediction is only a guess, e.g., evaluation episodes may end early.
+    def _predict_next_workload(self):
+        if self.environment_type == EnvironmentType.TRAINING:
+            if self.similar_workloads:
+                workloads = self.workloads if len(self.workloads) > 0 else self.config["workloads"]
+                next_workload_idx = 0 + self.env_id * 200
+                return workloads[next_workload_idx] if next_workload_idx < len(workloads) else None
+            self.next_workload = self.rnd.choice(self.workloads)
+            return self.next_workload
+        return self.workloads[(self.current_workload_idx + 1) % len(self.workloads)]
+
+    def _prefetch_next_workload(self):
+        next_workload = self._predict_next_workload()
+        if next_workload is None:
+            return
+
+        # Only plans and percentiles that the environment's cost evaluation misses are fetched
+        queries = [query for query in next_workload.queries if query.text not in self.cost_evaluation.cache]
+        columns = []
+        for query in next_workload.queries:
+            for column in query.columns:
+                if (
+                    column in self.partitioned_columns
+                    and column not in self.cost_evaluation.cache_percentiles
+                    and column not in columns
+                ):
+                    columns.append(column)
+
+        if len(queries) > 0 or len(columns) > 0:
+            self.prefetch_future = self.prefetch_executor.submit(self._fetch_plans_and_percentiles, queries, columns)
+
+    # Runs in the prefetch thread
+    def _fetch_plans_and_percentiles(self, queries, columns):
+        if self.prefetch_cost_evaluation is None:
+            # Created in the prefetch thread because SQLite connections cannot be shared between threads
+            self.prefetch_cost_evaluation = CostEvaluation(
+                self.config["connector_factory"](self.config["database_name"], autocommit=True),
+                self.all_partitions_flat,
+                persistent_cache_path=self.config["persistent_cost_cache"],
+            )
+        cost_evaluation = self.prefetch_cost_evaluation
+
+        cost_evaluation.prefetch_plans(queries)
+        plans = {query.text: cost_evaluation._request_cache_plans(query)[1] for query in queries}
+        percentiles = {column: cost_evaluation._request_cache_percentiles(column) for column in columns}
+
+        # The results are kept by the environment's cost evaluation
+        cost_evaluation.cache.clear()
+        cost_evaluation.cache_percentiles.clear()
+
+        return plans, percentiles
+
+    def _merge_prefetched_workload(self):
+        if self.prefetch_future is None:
+            return
+
+        try:
+            plans, percentiles = self.prefetch_future.result()
+            self.cost_evaluation.add_prefetched(plans, percentiles)
+        except Exception as e:
+            logging.warning(f"Prefetching the workload of env {self.env_id} failed: {e}")
+        self.prefetch_future = None
+
+    def _close_prefetch_cost_evaluation(self):
+        if self.prefetch_cost_evaluation is not None:
+            self.prefetch_cost_evaluation.complete_cost_estimation()
+            self.prefetch_cost_evaluation.db_connector.close()
+
+    def _lookup_transition(self, action):
+        if self.transition_cache is None:
+            return None
+        self._discard_stale_observations()
+        self.transition_requests += 1
+        transition = self.transition_cache.get((id(self.current_workload), self.current_partitions, action))
+        if transition is not None:
+            self.transition_hits += 1
+        return transition
+
+    def _store_transition(self, action, observation):
+        if self.transition_cache is None:
+            return
+        cost_and_plans = (self.current_costs, self.current_plans_per_query, self.current_costs_per_query)
+        self.transition_cache[(id(self.current_workload), self.current_partitions, action)] = (
+            cost_and_plans,
+            observation.copy(),
         )
 
+    def _workload_embedder_version(self):
+        workload_embedder = getattr(self.observation_manager, "workload_embedder", None)
+        return getattr(workload_embedder, "model_version", 0)
+
+    # Cached observations embed plans with the model they were created with, e.g., before an online update
+    def _discard_stale_observations(self):
+        embedder_version = self._workload_embedder_version()
+        if embedder_version == self.embedder_version:
+            return
+        self.embedder_version = embedder_version
+        if self.transition_cache is not None:
+            self.transition_cache.clear()
+        if self.initial_state_cache is not None:
+            self.initial_state_cache.clear()
+
+    def _copy_observation(self, observation):
+        if self.observation_out is None:
+            return observation.copy()
+        self.observation_out[:] = observation
+        return self.observation_out
+
+    # cost_and_plans can be passed if they are already known, e.g., from the transition cache
+    def _update_return_env_state(self, init, new_partition=None, cost_and_plans=None):
+        if cost_and_plans is not None:
+            total_costs, plans_per_query, costs_per_query = cost_and_plans
+        elif init:
+            total_costs, plans_per_query, costs_per_query = self.cost_evaluation.calculate_cost_and_plans(
+                self.current_workload, self.current_partitions
+            )
+        else:
+            # A new partition only changes the costs of the queries on its column
+            total_costs, plans_per_query, costs_per_query = self.cost_evaluation.update_cost_and_plans(
+                self.current_workload,
+                self.current_partitions,
+                new_partition,
+                self.current_costs,
+                self.current_plans_per_query,
+                self.current_costs_per_query,
+            )
+        self.current_plans_per_query = plans_per_query
+        self.current_costs_per_query = costs_per_query
+
         if not init:
             self.previous_cost = self.current_costs
 
@@ -171,17 +400,66 @@ class DBEnvV2(gym.Env):
         return environment_state
 
     def get_cost_eval_cache_info(self):
-        return self.cost_evaluation.cost_requests, self.cost_evaluation.cache_hits, self.cost_evaluation.costing_time
+        if not self.reports_cost_evaluation:
+            return 0, 0, datetime.timedelta(0), 0, 0, 0, self._cache_info()
+        return (
+            self.cost_evaluation.cost_requests,
+            self.cost_evaluation.cache_hits,
+            self.cost_evaluation.costing_time,
+            self.cost_evaluation.estimated_cost_requests,
+            self.cost_evaluation.estimated_cost_hits,
+            self.cost_evaluation.shared_cache_hits,
+            self._cache_info(),
+        )
+
+    def _cache_info(self):
+        cache_info = {}
+        if self.reports_cost_evaluation:
+            cache_info.update(self.cost_evaluation.cache_info())
+            workload_embedder = getattr(self.observation_manager, "workload_embedder", None)
+            if workload_embedder is not None and hasattr(workload_embedder, "plan_embedding_cache"):
+                cache_info["plan_embeddings"] = workload_embedder.plan_embedding_cache.info()
+        if self.transition_cache is not None:
+            cache_info["transitions"] = {
+                **self.transition_cache.info(),
+                "hits": self.transition_hits,
+                "requests": self.transition_requests,
+            }
+        return cache_info
+
+    def _log_cache_info(self):
+        if not self.reports_cost_evaluation and self.transition_cache is None:
+            return
+        cache_sizes = ", ".join(
+            f"{name}: {info['entries']} entries ({b_to_mb(info['bytes']):.2f} MB, {info['evictions']} evictions)"
+            for name, info in self._cache_info().items()
+        )
+        if self.transition_cache is not None:
+            cache_sizes += f", transition hits: {self.transition_hits} of {self.transition_requests}"
+        logging.info(f"Env {self.env_id} caches after {self.number_of_resets} resets - {cache_sizes}")
 
     def get_cost_eval_cache(self):
-        return self.cost_evaluation.cache
+        if not self.reports_cost_evaluation:
+            return {}
+        return dict(self.cost_evaluation.cache.items())
 
     # BEGIN OF NOT IMPLEMENTED ##########
     def render(self, mode="human"):
         print("render() was called")
         pass
 
+    # Appends the responses recorded since the last save, see replay_connector.RecordingConnector
+    def save_database_responses(self):
+        if isinstance(self.connector, RecordingConnector):
+            self.connector.save()
+
     def close(self):
         print("close() was called")
+        if self.prefetch_executor is not None:
+            self.prefetch_executor.submit(self._close_prefetch_cost_evaluation).result()
+            self.prefetch_executor.shutdown()
+        # Shared connections are closed by their owner, e.g., DBVecEnvV2. Closing also saves recorded responses.
+        if self.owns_connector:
+            self.connector.close()
 
     # END OF NOT IMPLEMENTED ##########
@@ -0,0 +1,108 @@
+import numpy as np
+
+from gym_db.common import EnvironmentType
+from gym_db.envs.db_env_v2 import DBEnvV2, create_cost_evaluation
+
+try:
+    from stable_baselines.common.vec_env import VecEnv
+except ImportError:
+    from stable_baselines3.common.vec_env import VecEnv
+
+
+# Steps several DBEnvV2 environments in the current process instead of one process per environment
+# (SubprocVecEnv). All environments share one database connection and one CostEvaluation, i.e.,
+# one set of caches, and nothing is pickled between processes.
+# Observations, rewards, and action masks are returned as (number of environments, ...) arrays.
+# The environments write their observations directly into the rows of the observation array.
+# Like SubprocVecEnv, finished environments are reset automatically: the returned observation and
+# info["action_mask"] belong to the new episode, the last observation is kept in info["terminal_observation"].
+class DBVecEnvV2(VecEnv):
+    def __init__(self, configs, environment_type=EnvironmentType.TRAINING):
+        assert len(configs) > 0, "DBVecEnvV2 needs at least one environment configuration."
+
+        self.connector = configs[0]["connector_factory"](configs[0]["database_name"], autocommit=True)
+        self.cost_evaluation = create_cost_evaluation(configs[0], self.connector)
+
+        self.envs = [
+            DBEnvV2(
+                environment_type=environment_type,
+                config=config,
+                cost_evaluation=self.cost_evaluation,
+                reports_cost_evaluation=env_idx == 0,
+            )
+            for env_idx, config in enumerate(configs)
+        ]
+        VecEnv.__init__(self, len(self.envs), self.envs[0].observation_space, self.envs[0].action_space)
+
+        self.observations = np.zeros(
+            (self.num_envs,) + self.observation_space.shape, dtype=self.observation_space.dtype
+        )
+        self.rewards = np.zeros(self.num_envs, dtype=np.float32)
+        self.dones = np.zeros(self.num_envs, dtype=bool)
+        self.action_masks = np.zeros((self.num_envs, self.action_space.n), dtype=np.float32)
+        self.actions = None
+
+        # Observations are only written into the buffer from the first reset on
+        for env_idx, env in enumerate(self.envs):
+            env.observation_out = self.observations[env_idx]
+            self.action_masks[env_idx] = env.valid_actions
+
+    def reset(self):
+        for env_idx, env in enumerate(self.envs):
+            env.reset()
+            self.action_masks[env_idx] = env.valid_actions
+        return self.observations.copy()
+
+    def step_async(self, actions):
+        self.actions = actions
+
+    def step_wait(self):
+        infos = []
+        for env_idx, env in enumerate(self.envs):
+            observation, reward, done, info = env.step(int(self.actions[env_idx]))
+            if done:
+                # The observation is a view on the buffer that the reset overwrites
+                info["terminal_observation"] = observation.copy()
+                env.reset()
+                info["action_mask"] = env.valid_actions
+            self.rewards[env_idx] = reward
+            self.dones[env_idx] = done
+            self.action_masks[env_idx] = info["action_mask"]
+            infos.append(info)
+
+        return self.observations.copy(), self.rewards.copy(), self.dones.copy(), infos
+
+    # Valid actions of all environments as one (number of environments, number of actions) array
+    def get_action_masks(self):
+        return self.action_masks.copy()
+
+    def close(self):
+        for env in self.envs:
+            env.close()
+        self.cost_evaluation.complete_cost_estimation()
+        self.connector.close()
+
+    def seed(self, seed=None):
+        return [env.seed(None if seed is None else seed + env_idx) for env_idx, env in enumerate(self.envs)]
+
+    def get_attr(self, attr_name, indices=None):
+        return [getattr(env, attr_name) for env in self._get_target_envs(indices)]
+
+    def set_attr(self, attr_name, value, indices=None):
+        for env in self._get_target_envs(indices):
+            setattr(env, attr_name, value)
+
+    def env_method(self, method_name, *method_args, indices=None, **method_kwargs):
+        return [
+            getattr(env, method_name)(*method_args, **method_kwargs) for env in self._get_target_envs(indices)
+        ]
+
+    def env_is_wrapped(self, wrapper_class, indices=None):
+        return [isinstance(env, wrapper_class) for env in self._get_target_envs(indices)]
+
+    def _get_target_envs(self, indices):
+        if indices is None:
+            return self.envs
+        if isinstance(indices, int):
+            indices = [indices]
+        return [self.envs[env_idx] for env_idx in indices]
@@ -0,0 +1,34 @@
+import pytest
+
+from SWPRL.expression_parser import ExpressionParser
+
+
+@pytest.fixture
+def parser():
+    return ExpressionParser()
+
+
+@pytest.mark.parametrize(
+    "expression, expected",
+    [
+        ("(t_ca_id = ANY ('{9,10,11}'::integer[]))", {"t_ca_id": (9, 11)}),
+        ("(t_ca_id = ANY ('{1,2,10}'::bigint[]))", {"t_ca_id": (1, 10)}),
+        ("(t_ca_id = ANY ('{-4,NULL,1}'::integer[]))", {"t_ca_id": (-4, 1)}),
+        ("(price = ANY ('{10.5,2,9.25}'::numeric[]))", {"price": (2, 10.5)}),
+        ("(price = ANY ('{10,2.5}'::double precision[]))", {"price": (2.5, 10)}),
+        ("(t_dts = ANY ('{2020-01-02,2019-12-31,2020-01-10}'::date[]))", {"t_dts": ("2019-12-31", "2020-01-10")}),
+        ("((t_st_id)::text = ANY ('{SBMT,CMPT,PNDG}'::text[]))", {"t_st_id": ("CMPT", "SBMT")}),
+        ("(t_ca_id = ANY (ARRAY[9, 10, 11]))", {"t_ca_id": (9, 11)}),
+    ],
+)
+def test_any_arrays(parser, expression, expected):
+    assert parser.intervals(expression) == expected
+
+
+def test_invalid_numeric_array_element(parser):
+    assert parser.intervals("(t_ca_id = ANY ('{9,abc}'::integer[]))") == {}
+
+
+def test_comparisons(parser):
+    assert parser.intervals("((t_ca_id >= 5) AND (t_ca_id < 10))") == {"t_ca_id": (5, 10)}
+    assert parser.intervals("((t_dts)::date = '2020-01-02'::date)") == {"t_dts": ("2020-01-02", "2020-01-02")}
@@ -0,0 +1,74 @@
+import argparse
+
+import numpy as np
+import pytest
+
+from SWPRL.plan import PlanNode
+from SWPRL.scripts.benchmark_environment import SyntheticBenchmark
+from SWPRL.workload_embedder import PlanEmbedder, PlanEmbedderHashedRandomProjection, PlanEmbedderLSIBOW
+
+REPRESENTATION_SIZE = 6
+
+
+@pytest.fixture(scope="module")
+def benchmark():
+    arguments = argparse.Namespace(
+        seed=60,
+        tables=3,
+        columns=4,
+        query_classes=20,
+        workloads=2,
+        workload_size=5,
+        plan_depth=4,
+        representation_size=REPRESENTATION_SIZE,
+    )
+    return SyntheticBenchmark(arguments)
+
+
+def plans_of(benchmark, query_texts):
+    return [PlanNode.from_dict(benchmark.plans_by_text[texts[0]]) for texts in query_texts]
+
+
+# Every embedder that the experiments can configure, including ones added later
+@pytest.mark.parametrize("embedder_class", PlanEmbedder.__subclasses__(), ids=lambda embedder_class: embedder_class.__name__)
+def test_get_embeddings(benchmark, embedder_class):
+    embedder = embedder_class(benchmark.query_texts, REPRESENTATION_SIZE, benchmark.connector, benchmark.columns_flat)
+    plans = plans_of(benchmark, benchmark.query_texts)
+
+    embeddings = embedder.get_embeddings(plans)
+    assert embeddings.shape == (len(plans), REPRESENTATION_SIZE)
+    assert np.isfinite(embeddings).all()
+    # The second call is served from the plan embedding cache
+    assert np.array_equal(embedder.get_embeddings(plans), embeddings)
+
+
+def test_online_update_adds_unknown_operators(benchmark):
+    known_query_texts = benchmark.query_texts[:10]
+    embedder = PlanEmbedderLSIBOW(
+        known_query_texts, REPRESENTATION_SIZE, benchmark.connector, benchmark.columns_flat, online_update=True
+    )
+    number_of_terms = len(embedder.dictionary)
+
+    embeddings = embedder.get_embeddings(plans_of(benchmark, benchmark.query_texts[10:]))
+    assert embeddings.shape == (10, REPRESENTATION_SIZE)
+    assert len(embedder.dictionary) > number_of_terms
+    assert embedder.model_version == 1
+    assert embedder.projection.shape == (len(embedder.dictionary), REPRESENTATION_SIZE)
+
+
+def test_without_online_update_unknown_operators_are_dropped(benchmark):
+    embedder = PlanEmbedderLSIBOW(
+        benchmark.query_texts[:10], REPRESENTATION_SIZE, benchmark.connector, benchmark.columns_flat
+    )
+    number_of_terms = len(embedder.dictionary)
+
+    embedder.get_embeddings(plans_of(benchmark, benchmark.query_texts[10:]))
+    assert len(embedder.dictionary) == number_of_terms
+    assert embedder.model_version == 0
+
+
+def test_hashed_embedder_refuses_online_update(benchmark):
+    with pytest.raises(ValueError):
+        PlanEmbedderHashedRandomProjection(
+            benchmark.query_texts, REPRESENTATION_SIZE, benchmark.connector, benchmark.columns_flat, online_update=True
+        )